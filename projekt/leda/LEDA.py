@@ -1,10 +1,14 @@
+import copy
 import hashlib
-import numpy as np
 
 
 class LEDA:
+    OPTIONS = ('MUL_ENGINE', 'INV_ENGINE', 'DRBG', 'METRICS', 'SYND_TRESH_LOOKUP_TABLE', 'DECODER', 'KEYSTORE', 'FORMAT')
+
     def __init__(self, N0, P, DV, MS, NUM_ERRORS_T, MAX_ENCODABLE_BIT_SIZE_CW_ENCODING,
-                 HASH_FUNC, HASH_BYTE_LENGTH, TRNG_BYTE_LENGTH, SYND_TRESH_LOOKUP_TABLE):
+                 HASH_FUNC, HASH_BYTE_LENGTH, TRNG_BYTE_LENGTH, SYND_TRESH_LOOKUP_TABLE,
+                 MUL_ENGINE='comb', INV_ENGINE='itoh_tsujii', DRBG='mt', METRICS=None,
+                 DECODER='vectorized', KEYSTORE=None, FORMAT='legacy'):
         self.N0 = N0
         self.P = P
         self.DV = DV
@@ -24,6 +28,22 @@ class LEDA:
         self.KOBARA_IMAI_DOMAIN_SEPARATION_CONSTANT_MIN_BIT_LENGTH = 2
         self.KOBARA_IMAI_MAX_PTX_BIT_LENGTH = self.K + self.CONSTANT_WEIGHT_ENCODED_DATA_ACTUAL_BIT_LENGTH - 8 * HASH_BYTE_LENGTH - self.KOBARA_IMAI_DOMAIN_SEPARATION_CONSTANT_MIN_BIT_LENGTH
 
+        self.MUL_ENGINE = MUL_ENGINE
+        self.INV_ENGINE = INV_ENGINE
+        self.DRBG = DRBG
+        self.METRICS = METRICS
+        self.DECODER = DECODER
+        self.KEYSTORE = KEYSTORE
+        self.FORMAT = FORMAT
+
+    def configure(self, **options):
+        leda = copy.copy(self)
+        for name, value in options.items():
+            if name not in LEDA.OPTIONS:
+                raise Exception("Unknown LEDA option " + name)
+            setattr(leda, name, value)
+        return leda
+
     def q_block_weight(self, r, c):
         return self.MS[c - r]
 
@@ -34,22 +54,16 @@ class LEDA:
         return slice(self.P*i, self.P*(i+1))
 
 
-def sha3_256(bitarray):
-    bintxt = bytes((bitarray.reshape(-1, 8) * np.array([128, 64, 32, 16, 8, 4, 2, 1]).reshape(1, 8)).sum(axis=1).tolist())
-    h = hashlib.sha3_256(bintxt).digest()
-    return np.array(list(map(lambda v: [v & (0x1 << i) for i in reversed(range(8))], h)), dtype=bool).reshape(1, -1)
+def sha3_256(data):
+    return hashlib.sha3_256(data).digest()
 
 
-def sha3_384(bitarray):
-    bintxt = bytes((bitarray.reshape(-1, 8) * np.array([128, 64, 32, 16, 8, 4, 2, 1]).reshape(1, 8)).sum(axis=1).tolist())
-    h = hashlib.sha3_384(bintxt).digest()
-    return np.array(list(map(lambda v: [v & (0x1 << i) for i in reversed(range(8))], h)), dtype=bool).reshape(1, -1)
+def sha3_384(data):
+    return hashlib.sha3_384(data).digest()
 
 
-def sha3_512(bitarray):
-    bintxt = bytes((bitarray.reshape(-1, 8) * np.array([128, 64, 32, 16, 8, 4, 2, 1]).reshape(1, 8)).sum(axis=1).tolist())
-    h = hashlib.sha3_512(bintxt).digest()
-    return np.array(list(map(lambda v: [v & (0x1 << i) for i in reversed(range(8))], h)), dtype=bool).reshape(1, -1)
+def sha3_512(data):
+    return hashlib.sha3_512(data).digest()
 
 
 class LEDACat:
@@ -156,36 +170,52 @@ class LEDACat:
         ]
     }
 
-    __instances_1 = {
-        2: LEDA(2, 15013, 9, [5, 4], 143, 1304, sha3_256, 32, 24, __synd_tresh_lookup_tables_1[2]),
-        3: LEDA(3, 9643, 13, [3, 2, 2], 90, 874, sha3_256, 32, 24, __synd_tresh_lookup_tables_1[3]),
-        4: LEDA(4, 8467, 11, [3, 2, 2, 2], 72, 738, sha3_256, 32, 24, __synd_tresh_lookup_tables_1[4])
+    __parameters_1 = {
+        2: (2, 15013, 9, [5, 4], 143, 1304, sha3_256, 32, 24, __synd_tresh_lookup_tables_1[2]),
+        3: (3, 9643, 13, [3, 2, 2], 90, 874, sha3_256, 32, 24, __synd_tresh_lookup_tables_1[3]),
+        4: (4, 8467, 11, [3, 2, 2, 2], 72, 738, sha3_256, 32, 24, __synd_tresh_lookup_tables_1[4])
     }
 
-    __instances_2 = {
-        2: LEDA(2, 24533, 13, [5, 4], 208, 1933, sha3_384, 48, 32, __synd_tresh_lookup_tables_2[2]),
-        3: LEDA(3, 17827, 15, [4, 3, 2], 129, 1302, sha3_384, 48, 32, __synd_tresh_lookup_tables_2[3]),
-        4: LEDA(4, 14717, 15, [3, 2, 2, 2], 104, 1096, sha3_384, 48, 32, __synd_tresh_lookup_tables_2[4])
+    __parameters_2 = {
+        2: (2, 24533, 13, [5, 4], 208, 1933, sha3_384, 48, 32, __synd_tresh_lookup_tables_2[2]),
+        3: (3, 17827, 15, [4, 3, 2], 129, 1302, sha3_384, 48, 32, __synd_tresh_lookup_tables_2[3]),
+        4: (4, 14717, 15, [3, 2, 2, 2], 104, 1096, sha3_384, 48, 32, __synd_tresh_lookup_tables_2[4])
     }
 
-    __instances_4 = {
-        2: LEDA(2, 37619, 11, [7, 6], 272, 2592, sha3_512, 64, 40, __synd_tresh_lookup_tables_4[2]),
-        3: LEDA(3, 28477, 13, [5, 4, 4], 172, 1783, sha3_512, 64, 40, __synd_tresh_lookup_tables_4[3]),
-        4: LEDA(4, 22853, 13, [4, 3, 3, 3], 135, 1459, sha3_512, 64, 40, __synd_tresh_lookup_tables_4[4])
+    __parameters_4 = {
+        2: (2, 37619, 11, [7, 6], 272, 2592, sha3_512, 64, 40, __synd_tresh_lookup_tables_4[2]),
+        3: (3, 28477, 13, [5, 4, 4], 172, 1783, sha3_512, 64, 40, __synd_tresh_lookup_tables_4[3]),
+        4: (4, 22853, 13, [4, 3, 3, 3], 135, 1459, sha3_512, 64, 40, __synd_tresh_lookup_tables_4[4])
     }
 
-    __categories_instances_map = {
-        1: __instances_1,
-        2: __instances_2,
-        3: __instances_2,
-        4: __instances_4,
-        5: __instances_4
+    __categories_parameters_map = {
+        1: __parameters_1,
+        2: __parameters_2,
+        3: __parameters_2,
+        4: __parameters_4,
+        5: __parameters_4
     }
 
+    # LEDA instances are built on first request and shared afterwards, keyed by (N0, P)
+    __instances = {}
+
     @staticmethod
     def get(CATEGORY, N0):
         if CATEGORY < 1 or CATEGORY > 5:
             raise Exception("CATEGORY must be 1, 2, 3, 4 or 5")
         if N0 < 2 or N0 > 4:
             raise Exception("N0 must be 2, 3 or 4")
-        return LEDACat.__categories_instances_map[CATEGORY][N0]
\ No newline at end of file
+        parameters = LEDACat.__categories_parameters_map[CATEGORY][N0]
+        instance = LEDACat.__instances.get((N0, parameters[1]))
+        if instance is None:
+            instance = LEDACat.__instances.setdefault((N0, parameters[1]), LEDA(*parameters))
+        return instance
+
+    # Lowest category whose parameter set leda belongs to (categories 2/3 and 4/5 share parameters)
+    @staticmethod
+    def category(leda):
+        for CATEGORY in sorted(LEDACat.__categories_parameters_map):
+            parameters = LEDACat.__categories_parameters_map[CATEGORY].get(leda.N0)
+            if parameters is not None and parameters[1] == leda.P:
+                return CATEGORY
+        raise Exception("N0={} P={} is not a LEDA parameter set".format(leda.N0, leda.P))
@@ -0,0 +1,9 @@
+# Importing the package loads no other module; submodules are imported where used (from leda.encode import encode)
+# and parameter sets are built by the first LEDACat.get
+
+
+def __getattr__(name):
+    if name == 'LEDACat':
+        from .LEDA import LEDACat
+        return LEDACat
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
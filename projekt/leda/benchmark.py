@@ -0,0 +1,406 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+from .LEDA import LEDACat
+from .gf2x import gf2x_mod_mul, gf2x_mod_inverse
+from .gf2x_packed import GF2xPoly, MUL_ENGINES, INV_ENGINES
+from .keygen import keygen, calcLPosOnes, sparseToDense
+from .encode import encode, encode_many, encrypt, kobara_imai_encode
+from .decode import decode, private_syndrome, decoder_tables, get_decoder
+from .cw import binary_to_constant_weight_approximate, binary_to_constant_weight_fast
+from .private_key import PRIVATE_KEY_CACHE, expand_private_key
+from .public_key import PUBLIC_KEY_CACHE
+from .metrics import Metrics
+
+PARAMETER_SETS = [(category, n0) for category in (1, 2, 4) for n0 in (2, 3, 4)]
+
+
+def best_time(f, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_mul(repeat, reference=True):
+    rng = np.random.default_rng(0)
+    results = []
+    for category, n0 in PARAMETER_SETS:
+        leda = LEDACat.get(category, n0)
+        A = rng.integers(0, 2, leda.P).astype(bool)
+        B = rng.integers(0, 2, leda.P).astype(bool)
+        pa, pb = GF2xPoly.from_dense(A), GF2xPoly.from_dense(B)
+
+        row = {'category': category, 'n0': n0, 'P': leda.P}
+        if reference:
+            row['gf2x_mod_mul'] = best_time(lambda: gf2x_mod_mul(A, B), 1)
+        for engine in MUL_ENGINES:
+            row[engine] = best_time(lambda: pa.mul(pb, engine), repeat)
+        results.append(row)
+    return results
+
+
+def bench_inv(repeat, reference=True):
+    rng = np.random.default_rng(0)
+    results = []
+    for category, n0 in PARAMETER_SETS:
+        leda = LEDACat.get(category, n0)
+        A = rng.integers(0, 2, leda.P).astype(bool)
+        A[0] ^= A.sum() % 2 == 0
+        pa = GF2xPoly.from_dense(A)
+
+        row = {'category': category, 'n0': n0, 'P': leda.P}
+        if reference:
+            row['gf2x_mod_inverse'] = best_time(lambda: gf2x_mod_inverse(A), 1)
+        for engine in INV_ENGINES:
+            row[engine] = best_time(lambda: pa.inverse(engine), repeat)
+        results.append(row)
+    return results
+
+
+def bench_encode_many(repeat, reference=True, batch=64):
+    random.seed(0)
+    results = []
+    for category, n0 in PARAMETER_SETS:
+        leda = LEDACat.get(category, n0)
+        _, pk = keygen(leda)
+        messages = [random.randbytes(16) for _ in range(batch)]
+        encode(messages[0], pk, leda)
+
+        row = {'category': category, 'n0': n0, 'P': leda.P}
+        if reference:
+            row['encode loop'] = best_time(lambda: [encode(msg, pk, leda) for msg in messages], repeat) / batch
+        row['encode_many'] = best_time(lambda: encode_many(messages, pk, leda), repeat) / batch
+        results.append(row)
+    return results
+
+
+def sample_times(f, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples, q):
+    return float(np.percentile(samples, q))
+
+
+# Bytes each warm call allocates on top of what is already live: the traced peak during the call minus the
+# traced size before it. Arrays allocated and freed within the call count, so only a stage that allocates
+# nothing (beyond small Python objects) reports close to 0. Returns the mean and the largest over calls.
+def allocated_bytes(f, calls):
+    tracemalloc.start()
+    try:
+        allocated = []
+        for _ in range(calls):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            f()
+            allocated.append(tracemalloc.get_traced_memory()[1] - before)
+        return sum(allocated) / calls, max(allocated)
+    finally:
+        tracemalloc.stop()
+
+
+# Timings of one stage: throughput, latency percentiles in seconds, and the mean and peak bytes allocated per call
+def measure(f, repeat, warmup=True):
+    if warmup:
+        f()
+    samples = sample_times(f, repeat)
+    allocated, peak = allocated_bytes(f, min(repeat, 10))
+    return {
+        'ops_per_sec': len(samples) / sum(samples),
+        'min': min(samples),
+        'mean': sum(samples) / len(samples),
+        'p50': percentile(samples, 50),
+        'p90': percentile(samples, 90),
+        'p99': percentile(samples, 99),
+        'peak_bytes': peak,
+        'allocated_bytes': allocated,
+        'samples': len(samples)
+    }
+
+
+def random_constant_weight_input(leda, rng):
+    while True:
+        bits = rng.integers(0, 2, leda.CONSTANT_WEIGHT_ENCODED_DATA_ACTUAL_BIT_LENGTH).astype(bool)
+        if binary_to_constant_weight_fast(bits, leda) is not None:
+            return bits
+
+
+def bench_stages(repeat, reference=True):
+    random.seed(0)
+    rng = np.random.default_rng(0)
+    results = []
+    for category, n0 in PARAMETER_SETS:
+        leda = LEDACat.get(category, n0)
+        sk, pk = keygen(leda)
+        msg = b"LEDA benchmark message"
+        ctx = encode(msg, pk, leda)
+
+        key = PRIVATE_KEY_CACHE.get(sk, leda)
+        pkBlocks = PUBLIC_KEY_CACHE.get(pk, leda).blocks
+        informationWord, encodedError = kobara_imai_encode(msg, leda)
+        codeword = encrypt(pkBlocks, informationWord, encodedError, leda)
+        syndrome = private_syndrome(codeword, key, leda)
+        decoder_tables(key, leda)
+        Ln0 = GF2xPoly.from_sparse(key.L[leda.N0-1, :], leda.P)
+        cwInput = random_constant_weight_input(leda, rng)
+
+        stages = {
+            'keygen': lambda: keygen(leda),
+            'encode': lambda: encode(msg, pk, leda),
+            'decode': lambda: decode(ctx, sk, leda),
+            'calcLPosOnes': lambda: calcLPosOnes(key.H, key.Q, leda),
+            'inverse': lambda: Ln0.inverse(leda.INV_ENGINE, leda.MUL_ENGINE),
+            'constant_weight': lambda: binary_to_constant_weight_fast(cwInput, leda),
+            'encrypt': lambda: encrypt(pkBlocks, informationWord, encodedError, leda),
+            'syndrome': lambda: private_syndrome(codeword, key, leda),
+            'bf_decoding': lambda: get_decoder(leda.DECODER)(key, syndrome.copy(), leda),
+            'bf_incremental': lambda: get_decoder('incremental')(key, syndrome.copy(), leda),
+            'bf_backflip': lambda: get_decoder('backflip')(key, syndrome.copy(), leda)
+        }
+        if reference:
+            LDense = sparseToDense(key.L[leda.N0-1, :], leda)
+            stages['gf2x_mod_inverse'] = lambda: gf2x_mod_inverse(LDense)
+            stages['binary_to_constant_weight_approximate'] = lambda: binary_to_constant_weight_approximate(cwInput, leda)
+
+        row = {'category': category, 'n0': n0, 'P': leda.P}
+        for name, f in stages.items():
+            slow = name in ('gf2x_mod_inverse', 'binary_to_constant_weight_approximate')
+            row[name] = measure(f, 1 if slow else repeat, warmup=not slow)
+        results.append(row)
+    return results
+
+
+DECODER_STRATEGIES = ('vectorized', 'incremental', 'backflip')
+# Error weights as a fraction above the nominal T; the heavier ones mostly fail and show the cost of a failure
+DECODER_ERROR_EXCESS = (0.0, 0.1, 0.2)
+
+
+# Every decoder strategy on the same random syndromes at and above the nominal error weight: latency,
+# failures and bit-flipping iterations per column
+def bench_decoders(repeat, reference=True, trials=None):
+    trials = trials or 8 * repeat
+    results = []
+    for category, n0 in PARAMETER_SETS:
+        metrics = Metrics()
+        leda = LEDACat.get(category, n0).configure(METRICS=metrics)
+        key = expand_private_key(bytes(range(leda.TRNG_BYTE_LENGTH)), leda)
+        decoder_tables(key, leda)
+
+        row = {'category': category, 'n0': n0, 'P': leda.P}
+        for excess in DECODER_ERROR_EXCESS:
+            weight = int(leda.NUM_ERRORS_T * (1 + excess))
+            rng = np.random.default_rng([category, n0, weight])
+            errors = []
+            for _ in range(trials):
+                e = np.zeros(leda.N0*leda.P, dtype=bool)
+                e[rng.choice(leda.N0*leda.P, weight, replace=False)] = True
+                errors.append((e, private_syndrome(e, key, leda)))
+
+            for name in DECODER_STRATEGIES:
+                decoder = get_decoder(name)
+                decoder(key, errors[0][1].copy(), leda)
+                samples = []
+                failures = 0
+                iterations = 0
+                for e, syndrome in errors:
+                    syndrome = syndrome.copy()
+                    metrics.reset()
+                    start = time.perf_counter()
+                    decoded, success = decoder(key, syndrome, leda)
+                    samples.append(time.perf_counter() - start)
+                    failures += not (success and np.array_equal(decoded, e))
+                    iterations += metrics.last('bf_iterations')
+                row['{} T+{:.0f}%'.format(name, excess * 100)] = {
+                    'weight': weight,
+                    'p50': percentile(samples, 50),
+                    'mean': sum(samples) / len(samples),
+                    'failures': failures,
+                    'trials': trials,
+                    'iterations': iterations / trials
+                }
+        results.append(row)
+    return results
+
+
+# Runs in a fresh interpreter, so imports and the first call of each operation pay their full one-time cost
+STARTUP_SCRIPT = """
+import importlib, json, random, sys, time
+
+def timed(timings, name, f):
+    start = time.perf_counter()
+    result = f()
+    timings[name] = time.perf_counter() - start
+    return result
+
+package, category, n0 = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+timings = {}
+timed(timings, 'import package', lambda: importlib.import_module(package))
+modules = timed(timings, 'import modules', lambda: [importlib.import_module(package + '.' + m) for m in ('keygen', 'encode', 'decode')])
+keygen, encode, decode = modules[0].keygen, modules[1].encode, modules[2].decode
+leda = timed(timings, 'get', lambda: importlib.import_module(package).LEDACat.get(category, n0))
+random.seed(0)
+sk, pk = timed(timings, 'first keygen', lambda: keygen(leda))
+timed(timings, 'keygen', lambda: keygen(leda))
+ctx = timed(timings, 'first encode', lambda: encode(b'startup', pk, leda))
+timed(timings, 'encode', lambda: encode(b'startup', pk, leda))
+timed(timings, 'first decode', lambda: decode(ctx, sk, leda))
+timed(timings, 'decode', lambda: decode(ctx, sk, leda))
+print(json.dumps(timings))
+"""
+
+
+# Directory the package is imported from
+def package_root():
+    root = os.path.dirname(os.path.abspath(__file__))
+    for _ in __package__.split('.'):
+        root = os.path.dirname(root)
+    return root
+
+
+def bench_startup(repeat, reference=True):
+    results = []
+    for category, n0 in PARAMETER_SETS:
+        runs = []
+        for _ in range(repeat):
+            out = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, __package__, str(category), str(n0)],
+                                 cwd=package_root(), capture_output=True, text=True, check=True).stdout
+            runs.append(json.loads(out))
+        row = {'category': category, 'n0': n0, 'P': LEDACat.get(category, n0).P}
+        for name in runs[0]:
+            row[name] = percentile([run[name] for run in runs], 50)
+        results.append(row)
+    return results
+
+
+BENCHMARKS = {
+    'mul': bench_mul,
+    'inv': bench_inv,
+    'encode_many': bench_encode_many,
+    'stages': bench_stages,
+    'decoders': bench_decoders,
+    'startup': bench_startup
+}
+
+
+def row_seconds(value):
+    return value['p50'] if isinstance(value, dict) else value
+
+
+def print_table(results):
+    columns = [c for c in results[0] if c not in ('category', 'n0', 'P')]
+    print("{:>4} {:>3} {:>6} ".format("cat", "n0", "P") + " ".join("{:>16}".format(c[:16]) for c in columns))
+    for row in results:
+        print("{:>4} {:>3} {:>6} ".format(row['category'], row['n0'], row['P'])
+              + " ".join("{:>14.3f}ms".format(row_seconds(row[c]) * 1000) for c in columns))
+
+
+def print_stages(results):
+    print("{:>4} {:>3} {:<40} {:>10} {:>11} {:>11} {:>11} {:>10} {:>10}".format("cat", "n0", "stage", "ops/s", "p50", "p90", "p99", "peak", "alloc/call"))
+    for row in results:
+        for name, m in row.items():
+            if isinstance(m, dict):
+                print("{:>4} {:>3} {:<40} {:>10.1f} {:>9.3f}ms {:>9.3f}ms {:>9.3f}ms {:>8.1f}KB {:>8.1f}KB".format(
+                    row['category'], row['n0'], name, m['ops_per_sec'], m['p50'] * 1000, m['p90'] * 1000, m['p99'] * 1000, m['peak_bytes'] / 1024,
+                    m['allocated_bytes'] / 1024))
+
+
+def print_decoders(results):
+    print("{:>4} {:>3} {:>6} {:<12} {:>10} {:>10} {:>9} {:>10}".format("cat", "n0", "weight", "decoder", "p50", "mean", "failures", "iterations"))
+    for row in results:
+        for name, m in row.items():
+            if isinstance(m, dict):
+                print("{:>4} {:>3} {:>6} {:<12} {:>8.2f}ms {:>8.2f}ms {:>4}/{:<4} {:>10.1f}".format(
+                    row['category'], row['n0'], m['weight'], name.split(' ')[0], m['p50'] * 1000, m['mean'] * 1000,
+                    m['failures'], m['trials'], m['iterations']))
+
+
+def report(benchmark, args, results):
+    return {
+        'benchmark': benchmark,
+        'repeat': args.repeat,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'results': results
+    }
+
+
+# Compares median timings against a stored report; a row is a regression when it is slower than baseline by more than threshold
+def compare(results, baseline, threshold, out=sys.stdout):
+    baselineRows = {(row['category'], row['n0']): row for row in baseline['results']}
+    regressions = []
+    for row in results:
+        base = baselineRows.get((row['category'], row['n0']))
+        if base is None:
+            continue
+        for name, value in row.items():
+            if name in ('category', 'n0', 'P') or name not in base:
+                continue
+            old, new = row_seconds(base[name]), row_seconds(value)
+            ratio = new / old if old > 0 else float('inf')
+            status = 'REGRESSION' if ratio > 1 + threshold else 'ok'
+            print("cat {} n0 {} {:<40} {:>11.3f}ms -> {:>11.3f}ms {:>7.2f}x {}".format(
+                row['category'], row['n0'], name, old * 1000, new * 1000, ratio, status), file=out)
+            if status != 'ok':
+                regressions.append((row['category'], row['n0'], name, ratio))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmark', choices=list(BENCHMARKS), nargs='?', default='mul')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-reference', action='store_true')
+    parser.add_argument('--batch', type=int, default=64)
+    parser.add_argument('--json', metavar='PATH', help="write the results as JSON, '-' for stdout")
+    parser.add_argument('--compare', metavar='BASELINE', help="JSON report from an earlier run to check against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="allowed relative slowdown of the median time")
+    args = parser.parse_args()
+
+    options = {'batch': args.batch} if args.benchmark == 'encode_many' else {}
+    results = BENCHMARKS[args.benchmark](args.repeat, not args.no_reference, **options)
+
+    if args.json == '-':
+        json.dump(report(args.benchmark, args, results), sys.stdout, indent=2)
+        print()
+    else:
+        if args.benchmark == 'stages':
+            print_stages(results)
+        elif args.benchmark == 'decoders':
+            print_decoders(results)
+        else:
+            print_table(results)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report(args.benchmark, args, results), f, indent=2)
+        if args.benchmark == 'encode_many':
+            for row in results:
+                print("cat {} n0 {}: {:.1f} msg/s looped, {:.1f} msg/s batched".format(
+                    row['category'], row['n0'], 1 / row.get('encode loop', float('nan')), 1 / row['encode_many']))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['benchmark'] != args.benchmark:
+            raise Exception("Baseline is a '{}' report, not '{}'".format(baseline['benchmark'], args.benchmark))
+        out = sys.stderr if args.json == '-' else sys.stdout
+        regressions = compare(results, baseline, args.threshold, out)
+        if regressions:
+            print("{} regression(s) over {:.0f}%".format(len(regressions), args.threshold * 100), file=out)
+            sys.exit(1)
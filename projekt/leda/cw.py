@@ -1,5 +1,5 @@
 import numpy as np
-from utils import bitarray_to_int
+from .utils import bitarray_to_int
 
 
 def estimate_d_u(availablePositions, onesToPlace):
@@ -116,3 +116,112 @@ def constant_weight_to_binary(constantWeight, yBufferLen, leda):
         onesStillToPlace -= 1
 
     return out
+
+
+class BitReader:
+    def __init__(self, bits):
+        self.length = bits.shape[0]
+        self.value = int.from_bytes(np.packbits(bits).tobytes(), 'big') >> (-self.length % 8)
+        self.cursor = 0
+
+    def remaining(self):
+        return self.length - self.cursor
+
+    def read(self, amount):
+        if amount <= 0:
+            return 0
+        avail = self.remaining()
+        if amount <= avail:
+            self.cursor += amount
+            return (self.value >> (avail - amount)) & ((1 << amount) - 1)
+        self.cursor = self.length
+        return (self.value & ((1 << avail) - 1)) << (amount - avail)
+
+    # Consumes a run of ones and its terminating zero, reads past the end return zeros
+    def read_unary(self):
+        avail = self.remaining()
+        mask = (1 << avail) - 1
+        ones = avail - ((self.value & mask) ^ mask).bit_length()
+        self.cursor = min(self.cursor + ones + 1, self.length)
+        return ones
+
+
+class BitWriter:
+    def __init__(self):
+        self.value = 0
+        self.length = 0
+
+    def write(self, value, amount):
+        if amount > 0:
+            self.value = (self.value << amount) | (value & ((1 << amount) - 1))
+            self.length += amount
+
+    def write_unary(self, ones):
+        self.write(((1 << ones) - 1) << 1, ones + 1)
+
+    def to_bitarray(self, length):
+        if self.length > length:
+            raise Exception("Constant weight encoding does not fit into {} bits".format(length))
+        out = np.zeros(length, dtype=bool)
+        raw = (self.value << (-self.length % 8)).to_bytes((self.length + 7) // 8, 'big')
+        out[:self.length] = np.unpackbits(np.frombuffer(raw, dtype=np.uint8))[:self.length]
+        return out
+
+
+def binary_to_constant_weight_fast(buff, leda):
+    distanceBetweenOnes = np.zeros(leda.NUM_ERRORS_T, dtype=np.int64)
+    idxDistances = 0
+    onesStillToPlace = leda.NUM_ERRORS_T
+    outPositionsAvailable = leda.N0*leda.P
+    reader = BitReader(buff)
+
+    while idxDistances < leda.NUM_ERRORS_T and outPositionsAvailable > onesStillToPlace:
+        d, u = estimate_d_u(outPositionsAvailable, onesStillToPlace)
+
+        quotient = reader.read_unary()
+        distanceToBeComputed = reader.read(u-1) if u > 0 else 0
+
+        if distanceToBeComputed >= ((1 << u) - d):
+            distanceToBeComputed = 2*distanceToBeComputed + reader.read(1) - ((1 << u) - d)
+
+        distanceBetweenOnes[idxDistances] = distanceToBeComputed + quotient*d
+        outPositionsAvailable -= int(distanceBetweenOnes[idxDistances]) + 1
+        onesStillToPlace -= 1
+        idxDistances += 1
+
+    if outPositionsAvailable < onesStillToPlace:
+        return None
+
+    positions = np.cumsum(distanceBetweenOnes + 1) - 1
+    if positions[-1] >= leda.N0*leda.P:
+        return None
+
+    cw = np.zeros(leda.N0*leda.P, dtype=bool)
+    cw[leda.P*(positions // leda.P + 1) - positions % leda.P - 1] = 1
+    return cw
+
+
+def constant_weight_to_binary_fast(constantWeight, yBufferLen, leda):
+    positions = np.flatnonzero(constantWeight.reshape(leda.N0, leda.P)[:, ::-1])
+    distanceBetweenOnes = np.zeros(leda.NUM_ERRORS_T, dtype=np.int64)
+    distanceBetweenOnes[:positions.shape[0]] = np.diff(positions, prepend=-1) - 1
+
+    onesStillToPlace = leda.NUM_ERRORS_T
+    posStillAvailable = leda.N0*leda.P
+
+    writer = BitWriter()
+    for distance in distanceBetweenOnes.tolist():
+        d, u = estimate_d_u(posStillAvailable, onesStillToPlace)
+
+        # numpy integer division by d == 0 yields 0 in the reference codec
+        quotient, remainder = (distance // d, distance % d) if d > 0 else (0, 0)
+        writer.write_unary(quotient)
+
+        if remainder < ((1 << u) - d):
+            writer.write(remainder, u-1 if u > 0 else 0)
+        else:
+            writer.write(remainder + ((1 << u) - d), u)
+        posStillAvailable -= distance + 1
+        onesStillToPlace -= 1
+
+    return writer.to_bitarray(yBufferLen)
@@ -1,16 +1,60 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
-from random_utils import RNG
-from keygen import generateHPosOnes, generateQPosOnes, calcLPosOnes
-from gf2x import gf2x_transpose, gf2x_mod_mul_dense_to_sparse, gf2x_mod_add
-from utils import unpack_bytes, remove_padding, bytes_to_bitarray, bitarray_to_int
-from cw import constant_weight_to_binary
+from .random_utils import make_rng
+from .private_key import PRIVATE_KEY_CACHE, ExpandedPrivateKey
+from .gf2x_packed import GF2xPoly
+from .utils import BitBuffer
+from .cw import constant_weight_to_binary_fast
+from .metrics import stage
+from .workspace import get_workspace
+from .formats import ciphertext_bits
+
+
+ITERATIONS_MAX = 15
+
+
+# The ciphertext was well formed but did not decrypt: bit flipping left a nonzero syndrome, found an error of the
+# wrong weight, or the recovered plaintext padding is invalid. Malformed ciphertexts and keys raise
+# formats.FormatError before any decoding.
+class DecodingFailure(Exception):
+    pass
+
+
+def syndrome_threshold(syndrome_wt, leda):
+    synd_corrt_vec = leda.SYND_TRESH_LOOKUP_TABLE
+    min_idx = 0
+    max_idx = len(synd_corrt_vec) - 1
+    tresh_table_idx = (min_idx + max_idx) // 2
+    while min_idx < max_idx:
+        if synd_corrt_vec[tresh_table_idx][0] <= syndrome_wt:
+            min_idx = tresh_table_idx + 1
+        else:
+            max_idx = tresh_table_idx - 1
+        tresh_table_idx = (min_idx + max_idx) // 2
+    return synd_corrt_vec[tresh_table_idx][1]
+
+
+THRESHOLD_ARRAYS = {}
+
+
+# syndrome_threshold for every weight 0..P; the lookup only changes value where a weight crosses a table entry
+def threshold_array(leda):
+    table = tuple(tuple(row) for row in leda.SYND_TRESH_LOOKUP_TABLE)
+    cacheKey = (leda.P, table)
+    if cacheKey not in THRESHOLD_ARRAYS:
+        thresholds = np.zeros(leda.P + 1, dtype=np.int64)
+        bounds = sorted({0} | {w for w, _ in table if 0 < w <= leda.P}) + [leda.P + 1]
+        for start, end in zip(bounds, bounds[1:]):
+            thresholds[start:end] = syndrome_threshold(start, leda)
+        THRESHOLD_ARRAYS[cacheKey] = thresholds
+    return THRESHOLD_ARRAYS[cacheKey]
 
 
 def bf_decoding(HT, QT, privateSyndrome, leda):
     currQ_pos = np.zeros(leda.M, dtype=np.int32)
-    imax = 15 #ITERATIONS_MAX
-    synd_corrt_vec = leda.SYND_TRESH_LOOKUP_TABLE
+    imax = ITERATIONS_MAX
 
     out = np.zeros(leda.N0*leda.P, dtype=bool)
     while True:
@@ -20,17 +64,7 @@ def bf_decoding(HT, QT, privateSyndrome, leda):
             valueIdx = np.arange(leda.P).reshape(1, -1)
             upc[i*leda.P + valueIdx] += (currSyndrome[-((HT[i, :].reshape(-1, 1) + valueIdx) % leda.P) - 1] == 1).sum(axis=0)
 
-        syndrome_wt = currSyndrome.sum()
-        min_idx = 0
-        max_idx = len(synd_corrt_vec) - 1
-        tresh_table_idx = (min_idx + max_idx) // 2
-        while min_idx < max_idx:
-            if synd_corrt_vec[tresh_table_idx][0] <= syndrome_wt:
-                min_idx = tresh_table_idx + 1
-            else:
-                max_idx = tresh_table_idx - 1
-            tresh_table_idx = (min_idx + max_idx) // 2
-        corrt_syndrome_based = synd_corrt_vec[tresh_table_idx][1]
+        corrt_syndrome_based = syndrome_threshold(currSyndrome.sum(), leda)
 
         for i in range(leda.N0):
             for j in range(leda.P):
@@ -57,64 +91,387 @@ def bf_decoding(HT, QT, privateSyndrome, leda):
         if imax == 0 or privateSyndrome.sum() == 0:
             break
 
+    if leda.METRICS is not None:
+        leda.METRICS.record('bf_iterations', ITERATIONS_MAX - imax)
     return out, privateSyndrome.sum() == 0
 
 
-def decrypt_mceliece(ctx, sk, leda):
-    rng = RNG(sk)
-    H, HT = generateHPosOnes(rng, leda)
-    Q = generateQPosOnes(rng, leda)
-    L = calcLPosOnes(H, Q, leda)
+QT_ROW_BLOCKS = {}
+
+
+# Depends only on the parameter set, so it is built once and shared read-only by every key
+def qt_row_blocks(leda):
+    cacheKey = (leda.N0, tuple(leda.MS))
+    if cacheKey not in QT_ROW_BLOCKS:
+        QTBlocks = np.zeros((leda.N0, leda.M), dtype=np.int64)
+        for i in range(leda.N0):
+            endQblockIdx = 0
+            for blockIdx in range(leda.N0):
+                startQblockIdx = endQblockIdx
+                endQblockIdx += leda.q_block_weight(blockIdx, i)
+                QTBlocks[i, startQblockIdx:endQblockIdx] = blockIdx
+        QTBlocks.setflags(write=False)
+        QT_ROW_BLOCKS[cacheKey] = QTBlocks
+    return QT_ROW_BLOCKS[cacheKey]
+
+
+def bf_decoding_tables(HT, QT, leda):
+    QTBlocks = qt_row_blocks(leda)
+    flipOffsets = []
+    for i in range(leda.N0):
+        offsets = ((HT[QTBlocks[i], :] + QT[i, :].reshape(-1, 1)) % leda.P).reshape(-1)
+        values, counts = np.unique(offsets, return_counts=True)
+        flipOffsets.append(values[counts % 2 == 1])
+    return QTBlocks, flipOffsets
+
+
+def load_syndrome(privateSyndrome, ws, P):
+    syndrome = ws.buffer('syndrome', (P,), bool)
+    syndrome[:] = privateSyndrome[::-1]
+    return syndrome
+
+
+def upc_full(syndrome, HT, upc, ws, P):
+    syndromeExt = ws.buffer('syndromeExt', (2*P,), bool)
+    syndromeExt[:P] = syndrome
+    syndromeExt[P:] = syndrome
+    upc[:] = 0
+    for i in range(HT.shape[0]):
+        for h in HT[i, :].tolist():
+            upc[i, :P] += syndromeExt[h:h+P]
+    upc[:, P:] = upc[:, :P]
+
+
+# Toggling syndrome bit t moves upc[i, j] by one for every j = t - h, h in HT[i]
+def upc_update(upc, HT, changed, newlySet, ws, P):
+    sign = ws.scratch('upcSign', changed.shape[0], np.int32)
+    np.subtract(np.multiply(newlySet, 2, out=sign, casting='unsafe'), 1, out=sign)
+    for i in range(HT.shape[0]):
+        idx = ws.scratch('upcIdx', changed.shape[0] * HT.shape[1], np.int64).reshape(changed.shape[0], HT.shape[1])
+        np.subtract(changed.reshape(-1, 1), HT[i, :].reshape(1, -1), out=idx)
+        np.remainder(idx, P, out=idx)
+        np.add.at(upc[i, :P], idx, sign.reshape(-1, 1))
+    upc[:, P:] = upc[:, :P]
+
+
+def correlation_flips(upc, QTBlocks, QT, i, threshold, correlation, above, P):
+    correlation[:] = 0
+    for blockIdx, q in zip(QTBlocks[i].tolist(), QT[i, :].tolist()):
+        correlation += upc[blockIdx, q:q+P]
+    np.greater(correlation, threshold, out=above)
+    return np.flatnonzero(above)
+
+
+# Adds one to toggles at every syndrome position flipping bits `flips` of block i changes
+def add_flip_toggles(toggles, flips, offsets, ws, P):
+    idx = ws.scratch('flipIdx', flips.shape[0] * offsets.shape[0], np.int64).reshape(flips.shape[0], offsets.shape[0])
+    np.add(flips.reshape(-1, 1), offsets.reshape(1, -1), out=idx)
+    np.remainder(idx, P, out=idx)
+    np.add.at(toggles, idx, 1)
+
+
+def apply_toggles(syndrome, toggles):
+    np.bitwise_and(toggles, 1, out=toggles)
+    np.bitwise_xor(syndrome, toggles, out=syndrome, casting='unsafe')
+
+
+# Same decisions as bf_decoding: within an iteration every flip depends only on the upc snapshot,
+# so correlations and syndrome updates are applied for all N0*P positions at once
+def bf_decoding_vectorized(HT, QT, privateSyndrome, leda, tables=None):
+    QTBlocks, flipOffsets = tables if tables is not None else bf_decoding_tables(HT, QT, leda)
+    P = leda.P
+    ws = get_workspace(leda)
+
+    syndrome = load_syndrome(privateSyndrome, ws, P)
+    out = np.zeros(leda.N0*P, dtype=bool)
+    upc = ws.buffer('upc', (leda.N0, 2*P), np.int32)
+    correlation = ws.buffer('correlation', (P,), np.int32)
+    above = ws.buffer('above', (P,), bool)
+    toggles = ws.buffer('toggles', (P,), np.int64)
+    metrics = leda.METRICS
+    if metrics is not None:
+        syndromeWeights = []
+        thresholds = []
+    for iteration in range(ITERATIONS_MAX):
+        upc_full(syndrome, HT, upc, ws, P)
+
+        syndromeWeight = np.count_nonzero(syndrome)
+        threshold = syndrome_threshold(syndromeWeight, leda)
+        if metrics is not None:
+            syndromeWeights.append(int(syndromeWeight))
+            thresholds.append(threshold)
+
+        toggles[:] = 0
+        for i in range(leda.N0):
+            flips = correlation_flips(upc, QTBlocks, QT, i, threshold, correlation, above, P)
+            if flips.shape[0] > 0:
+                out[leda.getBlockSlice(i)][P - 1 - flips] ^= True
+                add_flip_toggles(toggles, flips, flipOffsets[i], ws, P)
+        apply_toggles(syndrome, toggles)
+
+        if not syndrome.any():
+            break
+
+    if metrics is not None:
+        metrics.record('bf_iterations', iteration + 1)
+        metrics.record('bf_syndrome_weights', syndromeWeights)
+        metrics.record('bf_thresholds', thresholds)
+    return out, not syndrome.any()
+
+
+INCREMENTAL_UPC_MAX_CHANGED = 8
+
+
+# Same decisions as bf_decoding_vectorized, but upc and the syndrome weight are updated only where the
+# syndrome changed, thresholds come from a precomputed array and decoding stops once no position flips
+def bf_decoding_incremental(HT, QT, privateSyndrome, leda, tables):
+    QTBlocks, flipOffsets = tables
+    P = leda.P
+    thresholds = threshold_array(leda)
+    ws = get_workspace(leda)
+
+    syndrome = load_syndrome(privateSyndrome, ws, P)
+    syndromeWeight = np.count_nonzero(syndrome)
+    out = np.zeros(leda.N0*P, dtype=bool)
+    upc = ws.buffer('upc', (leda.N0, 2*P), np.int32)
+    correlation = ws.buffer('correlation', (P,), np.int32)
+    above = ws.buffer('above', (P,), bool)
+    toggles = ws.buffer('toggles', (P,), np.int64)
+    upc_full(syndrome, HT, upc, ws, P)
+    metrics = leda.METRICS
+    if metrics is not None:
+        syndromeWeights = []
+        thresholdsUsed = []
+    for iteration in range(ITERATIONS_MAX):
+        threshold = thresholds[syndromeWeight]
+        if metrics is not None:
+            syndromeWeights.append(syndromeWeight)
+            thresholdsUsed.append(int(threshold))
+
+        toggles[:] = 0
+        for i in range(leda.N0):
+            flips = correlation_flips(upc, QTBlocks, QT, i, threshold, correlation, above, P)
+            if flips.shape[0] > 0:
+                out[leda.getBlockSlice(i)][P - 1 - flips] ^= True
+                add_flip_toggles(toggles, flips, flipOffsets[i], ws, P)
+
+        np.bitwise_and(toggles, 1, out=toggles)
+        changed = np.flatnonzero(toggles)
+        if changed.shape[0] == 0:
+            break
+        newlySet = ~syndrome[changed]
+        syndrome[changed] = newlySet
+        syndromeWeight += 2 * np.count_nonzero(newlySet) - changed.shape[0]
+        if syndromeWeight == 0:
+            break
+
+        if changed.shape[0] * INCREMENTAL_UPC_MAX_CHANGED > P:
+            upc_full(syndrome, HT, upc, ws, P)
+        else:
+            upc_update(upc, HT, changed, newlySet, ws, P)
+
+    if metrics is not None:
+        metrics.record('bf_iterations', iteration + 1)
+        metrics.record('bf_syndrome_weights', syndromeWeights)
+        metrics.record('bf_thresholds', thresholdsUsed)
+    return out, syndromeWeight == 0
+
+
+BACKFLIP_TTL_MIN = 6
+BACKFLIP_TTL_MAX = 10
+
+
+# Bit flipping where every flip into the error estimate is undone again after a time-to-live that grows with
+# how far its correlation cleared the threshold, unless the decoder reaches a zero syndrome first
+def bf_decoding_backflip(HT, QT, privateSyndrome, leda, tables):
+    QTBlocks, flipOffsets = tables
+    P = leda.P
+    thresholds = threshold_array(leda)
+    ws = get_workspace(leda)
+
+    syndrome = load_syndrome(privateSyndrome, ws, P)
+    out = np.zeros(leda.N0*P, dtype=bool)
+    estimate = ws.zeros('estimate', (leda.N0, P), bool)
+    expiry = ws.buffer('expiry', (leda.N0, P), np.int64)
+    expiry.fill(-1)
+    upc = ws.buffer('upc', (leda.N0, 2*P), np.int32)
+    correlation = ws.buffer('correlation', (P,), np.int32)
+    above = ws.buffer('above', (P,), bool)
+    toggles = ws.buffer('toggles', (P,), np.int64)
+    metrics = leda.METRICS
+    if metrics is not None:
+        syndromeWeights = []
+        thresholdsUsed = []
+    for iteration in range(ITERATIONS_MAX):
+        upc_full(syndrome, HT, upc, ws, P)
+        syndromeWeight = np.count_nonzero(syndrome)
+        threshold = thresholds[syndromeWeight]
+        if metrics is not None:
+            syndromeWeights.append(syndromeWeight)
+            thresholdsUsed.append(int(threshold))
+
+        toggles[:] = 0
+        for i in range(leda.N0):
+            np.equal(expiry[i], iteration, out=above)
+            expired = np.flatnonzero(above)
+            expiry[i, expired] = -1
+
+            flips = correlation_flips(upc, QTBlocks, QT, i, threshold, correlation, above, P)
+
+            estimate[i, flips] ^= True
+            added = flips[estimate[i, flips]]
+            expiry[i, flips] = -1
+            expiry[i, added] = iteration + np.minimum(BACKFLIP_TTL_MAX, BACKFLIP_TTL_MIN + correlation[added] - threshold - 1)
+
+            expired = np.setdiff1d(expired, flips, assume_unique=True)
+            estimate[i, expired] = False
+            flips = np.concatenate((flips, expired))
+            if flips.shape[0] > 0:
+                add_flip_toggles(toggles, flips, flipOffsets[i], ws, P)
+        apply_toggles(syndrome, toggles)
+
+        if not syndrome.any():
+            break
 
-    codewordPoly = ctx.copy()
     for i in range(leda.N0):
-        codewordPoly[leda.getBlockSlice(i)] = gf2x_transpose(leda.getBlock(codewordPoly, i))
+        out[leda.getBlockSlice(i)] = estimate[i, ::-1]
+    if metrics is not None:
+        metrics.record('bf_iterations', iteration + 1)
+        metrics.record('bf_syndrome_weights', syndromeWeights)
+        metrics.record('bf_thresholds', thresholdsUsed)
+    return out, not syndrome.any()
+
+
+def decoder_tables(key, leda):
+    return key.table('bf', lambda key: bf_decoding_tables(key.HT, key.QT, leda))
+
+
+def decode_reference(key, privateSyndrome, leda):
+    return bf_decoding(key.HT, key.QT, privateSyndrome.copy(), leda)
+
+
+def decode_vectorized(key, privateSyndrome, leda):
+    return bf_decoding_vectorized(key.HT, key.QT, privateSyndrome, leda, decoder_tables(key, leda))
+
+
+def decode_incremental(key, privateSyndrome, leda):
+    return bf_decoding_incremental(key.HT, key.QT, privateSyndrome, leda, decoder_tables(key, leda))
+
 
-    privateSyndrome = np.zeros(leda.P, dtype=bool)
+def decode_backflip(key, privateSyndrome, leda):
+    return bf_decoding_backflip(key.HT, key.QT, privateSyndrome, leda, decoder_tables(key, leda))
+
+
+# Decoders take an ExpandedPrivateKey and the private syndrome, and return the error estimate and whether it zeroes the syndrome.
+# 'python -m leda.benchmark decoders' compares them per parameter set at and above the nominal error weight:
+# - vectorized is the fastest at the nominal weight on every set, hence the default.
+# - incremental decides exactly like vectorized, but it stops once nothing flips. Syndromes that will fail end after
+#   about 6 iterations instead of ITERATIONS_MAX, so it is up to ~2.7x faster on them and the better choice for DFR
+#   runs above the design weight. On syndromes that decode it is up to ~65% slower.
+# - backflip is never the fastest. Only at error weights where the other decoders fail almost always does it recover
+#   some syndromes; nearer the design weight it fails more often. It is meant for such DFR comparisons, not decryption.
+DECODERS = {
+    'reference': decode_reference,
+    'vectorized': decode_vectorized,
+    'incremental': decode_incremental,
+    'backflip': decode_backflip
+}
+
+DEFAULT_DECODER = 'vectorized'
+
+
+def get_decoder(name):
+    if name not in DECODERS:
+        raise Exception("Unknown decoder '{}', expected one of: {}".format(name, ", ".join(DECODERS)))
+    return DECODERS[name]
+
+
+def private_syndrome(ctx, key, leda):
+    privateSyndrome = GF2xPoly.zero(leda.P)
     for i in range(leda.N0):
-        aux = gf2x_mod_mul_dense_to_sparse(leda.getBlock(codewordPoly, i), L[i, :], leda.P)
-        privateSyndrome = gf2x_mod_add(aux, privateSyndrome)
-    privateSyndrome = gf2x_transpose(privateSyndrome)
-
-    QT = np.zeros(Q.shape, dtype=np.int32)
-    transposed_ones_idx = np.zeros(leda.N0, dtype=np.uint32)
-    for source_row_idx in range(leda.N0):
-        currQoneIdx = 0
-        endQblockIdx = 0
-        for blockIdx in range(leda.N0):
-            endQblockIdx += leda.q_block_weight(source_row_idx, blockIdx)
-            while currQoneIdx < endQblockIdx:
-                QT[blockIdx, transposed_ones_idx[blockIdx]] = (leda.P - Q[source_row_idx, currQoneIdx]) % leda.P
-                transposed_ones_idx[blockIdx] += 1
-                currQoneIdx += 1
-
-    decoded_err, success = bf_decoding(HT, QT, privateSyndrome, leda)
+        codewordPoly = GF2xPoly.from_dense(leda.getBlock(ctx, i)).transpose()
+        privateSyndrome = privateSyndrome.add(codewordPoly.mul_sparse(key.L[i, :]))
+    return privateSyndrome.transpose().to_dense()
+
+
+def decrypt_mceliece(ctx, sk, leda):
+    decoder = get_decoder(leda.DECODER)
+    with stage(leda, 'private_key'):
+        key = PRIVATE_KEY_CACHE.get(sk, leda)
+        decoder_tables(key, leda)
+
+    with stage(leda, 'syndrome'):
+        privateSyndrome = private_syndrome(ctx, key, leda)
+
+    with stage(leda, 'bf_decoding'):
+        decoded_err, success = decoder(key, privateSyndrome, leda)
     if not success:
-        raise Exception("Decoding failed")
+        raise DecodingFailure("Decoding failed")
+    # a zero syndrome from an error of another weight is not a valid LEDA encryption
+    if np.count_nonzero(decoded_err) != leda.NUM_ERRORS_T:
+        raise DecodingFailure("Decoding failed: error vector of weight {}, expected {}".format(np.count_nonzero(decoded_err), leda.NUM_ERRORS_T))
 
-    correct_codeword = np.zeros(codewordPoly.shape, dtype=bool)
-    for i in range(leda.N0):
-        correct_codeword[leda.getBlockSlice(i)] = gf2x_mod_add(leda.getBlock(ctx, i), leda.getBlock(decoded_err, i))
+    correct_codeword = ctx ^ decoded_err
 
     return correct_codeword, decoded_err
 
 
 def decode(ctx, sk, leda):
-    ctx = unpack_bytes(ctx)
-    sk = int.from_bytes(sk, byteorder='big')
+    with stage(leda, 'decode'):
+        ctx = ciphertext_bits(ctx, leda)
+
+        codeword, err = decrypt_mceliece(ctx, sk, leda)
+
+        yBufferBitLength = leda.CONSTANT_WEIGHT_ENCODED_DATA_ACTUAL_BIT_LENGTH + leda.K
+        with stage(leda, 'constant_weight_to_binary'):
+            yBits = constant_weight_to_binary_fast(err, yBufferBitLength, leda)
+        yBits[leda.CONSTANT_WEIGHT_ENCODED_DATA_ACTUAL_BIT_LENGTH:] = codeword[:leda.K].reshape(leda.N0-1, leda.P)[:, ::-1].reshape(-1)
+        yBuffer = BitBuffer.from_bits(yBits)
+
+        hash = np.frombuffer(leda.HASH_FUNC(yBuffer.data[leda.HASH_BYTE_LENGTH:]), dtype=np.uint8)
+        secretSeed = BitBuffer(yBuffer.data[:leda.TRNG_BYTE_LENGTH] ^ hash[:leda.TRNG_BYTE_LENGTH]).to_int()
+        prngSeq = np.frombuffer(make_rng(secretSeed, leda).randombytes(yBufferBitLength // 8 - leda.HASH_BYTE_LENGTH), dtype=np.uint8)
+
+        ptx = BitBuffer(yBuffer.data[leda.HASH_BYTE_LENGTH:] ^ prngSeq)
+        try:
+            return ptx.remove_padding().tobytes()
+        except Exception:
+            raise DecodingFailure("Decoding failed: invalid plaintext padding") from None
+
+
+def decode_item(ctx, key, leda):
+    try:
+        return decode(ctx, key, leda)
+    except Exception as e:
+        return e
+
+
+# Set once per pool process by its initializer; the inline path of decode_many never touches it
+WORKER_STATE = {}
+
+
+def decode_worker_init(sk, leda):
+    WORKER_STATE['key'] = PRIVATE_KEY_CACHE.get(sk, leda)
+    WORKER_STATE['leda'] = leda
+
+
+def decode_worker_item(ctx):
+    return decode_item(ctx, WORKER_STATE['key'], WORKER_STATE['leda'])
 
-    codeword, err = decrypt_mceliece(ctx, sk, leda)
 
-    yBufferBitLength = leda.CONSTANT_WEIGHT_ENCODED_DATA_ACTUAL_BIT_LENGTH + leda.K
-    yBuffer = constant_weight_to_binary(err, yBufferBitLength, leda)
-    for i in range(leda.N0 - 1):
-        yBuffer[leda.CONSTANT_WEIGHT_ENCODED_DATA_ACTUAL_BIT_LENGTH:][leda.getBlockSlice(i)] = leda.getBlock(codeword, i)[::-1]
+# Results keep the order of ciphertexts; an item that fails is returned as its exception, FormatError for
+# malformed input and DecodingFailure when it does not decrypt
+def decode_many(ciphertexts, sk, leda, workers=None):
+    ciphertexts = list(ciphertexts)
+    if isinstance(sk, ExpandedPrivateKey):
+        sk = sk.seed
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, len(ciphertexts))
 
-    hash = leda.HASH_FUNC(yBuffer[8*leda.HASH_BYTE_LENGTH:])
-    secretSeed = yBuffer[:8*leda.TRNG_BYTE_LENGTH] ^ hash[0, :8*leda.TRNG_BYTE_LENGTH]
-    secretSeed = bitarray_to_int(secretSeed)
-    prngSeq = bytes_to_bitarray(RNG(secretSeed).randombytes(yBufferBitLength // 8 - leda.HASH_BYTE_LENGTH))
+    if workers <= 1:
+        key = PRIVATE_KEY_CACHE.get(sk, leda)
+        return [decode_item(ctx, key, leda) for ctx in ciphertexts]
 
-    ptx = yBuffer[8*leda.HASH_BYTE_LENGTH:] ^ prngSeq
-    ptx = remove_padding(ptx)
-    return np.packbits(ptx).tobytes()
+    with ProcessPoolExecutor(max_workers=workers, initializer=decode_worker_init, initargs=(sk, leda)) as executor:
+        chunksize = max(1, len(ciphertexts) // (4 * workers))
+        return list(executor.map(decode_worker_item, ciphertexts, chunksize=chunksize))
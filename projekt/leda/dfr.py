@@ -0,0 +1,194 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+from .LEDA import LEDACat
+from .decode import ITERATIONS_MAX, DECODERS, DEFAULT_DECODER, private_syndrome, decoder_tables, get_decoder
+from .private_key import PRIVATE_KEY_CACHE
+from .metrics import Metrics
+
+
+# z value of a two-sided 95% interval
+CONFIDENCE_Z = 1.959963984540054
+
+
+def dfr_key_seed(seed, keyIndex, leda):
+    return hashlib.sha256(b'LEDA-DFR' + seed.to_bytes(8, 'big') + keyIndex.to_bytes(8, 'big')).digest()[:leda.TRNG_BYTE_LENGTH]
+
+
+def random_error_vector(rng, leda):
+    e = np.zeros(leda.N0*leda.P, dtype=bool)
+    e[rng.choice(leda.N0*leda.P, leda.NUM_ERRORS_T, replace=False)] = True
+    return e
+
+
+DFR_WORKER_STATE = {}
+
+
+def dfr_worker_init(leda, seed, keys):
+    DFR_WORKER_STATE['leda'] = leda.configure(METRICS=Metrics())
+    DFR_WORKER_STATE['seed'] = seed
+    DFR_WORKER_STATE['keys'] = keys
+
+
+# Chunk i always draws the same errors for the same seed, so chunks can run in any order and resume later
+def dfr_chunk(index, trials):
+    leda, seed = DFR_WORKER_STATE['leda'], DFR_WORKER_STATE['seed']
+    metrics = leda.METRICS
+    key = PRIVATE_KEY_CACHE.get(dfr_key_seed(seed, index % DFR_WORKER_STATE['keys'], leda), leda)
+    decoder = get_decoder(leda.DECODER)
+    decoder_tables(key, leda)
+    rng = np.random.default_rng([seed, index])
+
+    iterations = [0] * (ITERATIONS_MAX + 1)
+    failures = 0
+    undetected = 0
+    for _ in range(trials):
+        e = random_error_vector(rng, leda)
+        metrics.reset()
+        decoded, success = decoder(key, private_syndrome(e, key, leda), leda)
+        if not success:
+            failures += 1
+        elif not np.array_equal(decoded, e):
+            failures += 1
+            undetected += 1
+        else:
+            iterations[metrics.last('bf_iterations')] += 1
+    return {'index': index, 'trials': trials, 'failures': failures, 'undetected': undetected, 'iterations': iterations}
+
+
+def wilson_interval(failures, trials, z=CONFIDENCE_Z):
+    if trials == 0:
+        return 0.0, 1.0
+    p = failures / trials
+    denominator = 1 + z*z / trials
+    center = (p + z*z / (2*trials)) / denominator
+    half = z * math.sqrt(p*(1 - p) / trials + z*z / (4*trials*trials)) / denominator
+    # center and half agree exactly at the edges; rounding would leave a bound like 1e-18 instead of 0
+    low = 0.0 if failures == 0 else max(0.0, center - half)
+    high = 1.0 if failures == trials else min(1.0, center + half)
+    return low, high
+
+
+def dfr_config(leda, seed, keys, chunkSize):
+    return {
+        'N0': leda.N0,
+        'P': leda.P,
+        'T': leda.NUM_ERRORS_T,
+        'thresholds': [list(row) for row in leda.SYND_TRESH_LOOKUP_TABLE],
+        'decoder': leda.DECODER,
+        'drbg': leda.DRBG,
+        'seed': seed,
+        'keys': keys,
+        'chunk': chunkSize
+    }
+
+
+def load_checkpoint(path):
+    if path is None or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+def dfr_summary(config, chunks):
+    trials = sum(c['trials'] for c in chunks)
+    failures = sum(c['failures'] for c in chunks)
+    iterations = [sum(c['iterations'][i] for c in chunks) for i in range(ITERATIONS_MAX + 1)]
+    low, high = wilson_interval(failures, trials)
+    decoded = trials - failures
+    return {
+        'config': config,
+        'trials': trials,
+        'failures': failures,
+        'undetected': sum(c['undetected'] for c in chunks),
+        'dfr': failures / trials if trials else 0.0,
+        'ci95': [low, high],
+        'iterations': iterations,
+        'mean_iterations': sum(i * n for i, n in enumerate(iterations)) / decoded if decoded else 0.0
+    }
+
+
+# Decodes trials random weight-T errors, split into chunks of chunkSize trials cycling over `keys` private keys.
+# Finished chunks are stored under `label` in the checkpoint file, a rerun with the same settings only does the rest.
+def simulate_dfr(leda, trials, seed=0, keys=1, chunkSize=100, workers=None, checkpoint=None, label='dfr', progress=None):
+    config = dfr_config(leda, seed, keys, chunkSize)
+    saved = load_checkpoint(checkpoint)
+    entry = saved.get(label)
+    if entry is None or entry['config'] != config:
+        entry = {'config': config, 'chunks': {}}
+        saved[label] = entry
+    chunks = entry['chunks']
+
+    chunkCount = (trials + chunkSize - 1) // chunkSize
+    pending = [(i, min(chunkSize, trials - i*chunkSize)) for i in range(chunkCount)
+               if str(i) not in chunks or chunks[str(i)]['trials'] < min(chunkSize, trials - i*chunkSize)]
+
+    def finish(result):
+        chunks[str(result['index'])] = result
+        if checkpoint is not None:
+            save_checkpoint(checkpoint, saved)
+        if progress is not None:
+            progress(dfr_summary(config, [chunks[str(i)] for i in range(chunkCount) if str(i) in chunks]))
+
+    workers = min(workers or os.cpu_count() or 1, max(1, len(pending)))
+    if workers <= 1:
+        dfr_worker_init(leda, seed, keys)
+        for index, count in pending:
+            finish(dfr_chunk(index, count))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=dfr_worker_init, initargs=(leda.configure(METRICS=None), seed, keys)) as executor:
+            futures = [executor.submit(dfr_chunk, index, count) for index, count in pending]
+            for future in as_completed(futures):
+                finish(future.result())
+
+    return dfr_summary(config, [chunks[str(i)] for i in range(chunkCount)])
+
+
+def print_summary(category, n0, summary):
+    low, high = summary['ci95']
+    print("cat {} n0 {}: {} failures in {} trials, DFR {:.3e} (95% CI {:.3e} .. {:.3e}), {} undetected, mean {:.2f} iterations".format(
+        category, n0, summary['failures'], summary['trials'], summary['dfr'], low, high, summary['undetected'], summary['mean_iterations']))
+    print("  iterations: " + " ".join("{}:{}".format(i, n) for i, n in enumerate(summary['iterations']) if n))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sets', default='1:2', help="comma separated CATEGORY:N0 pairs, or 'all'")
+    parser.add_argument('--trials', type=int, default=1000)
+    parser.add_argument('--chunk', type=int, default=100)
+    parser.add_argument('--keys', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--decoder', choices=list(DECODERS), default=DEFAULT_DECODER)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--checkpoint', metavar='PATH', help="JSON file to store finished chunks in and resume from")
+    parser.add_argument('--json', metavar='PATH', help="write the summaries as JSON")
+    args = parser.parse_args()
+
+    if args.sets == 'all':
+        sets = [(category, n0) for category in (1, 2, 4) for n0 in (2, 3, 4)]
+    else:
+        sets = [tuple(int(v) for v in s.split(':')) for s in args.sets.split(',')]
+
+    summaries = {}
+    for category, n0 in sets:
+        label = "{}:{}:{}".format(category, n0, args.decoder)
+        leda = LEDACat.get(category, n0).configure(DECODER=args.decoder)
+        summaries[label] = simulate_dfr(leda, args.trials, args.seed, args.keys, args.chunk,
+                                        args.workers, args.checkpoint, label)
+        print_summary(category, n0, summaries[label])
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summaries, f, indent=2)
@@ -1,64 +1,111 @@
 import numpy as np
-from gf2x import gf2x_mod_add, gf2x_mod_mul
-from random_utils import TRNG, RNG
-from utils import unpack_bytes, pack_bytes, int_to_bitarray, bytes_to_bitarray
-from cw import binary_to_constant_weight_approximate
-
-
-def plaintext_constant_pad(msgArr, yBufferBitLength, HASH_BYTE_LENGTH):
-    padded = np.zeros(yBufferBitLength, dtype=bool)
-    msgBitLen = msgArr.shape[0]
-
-    padded[8*HASH_BYTE_LENGTH:8*HASH_BYTE_LENGTH + msgBitLen] = msgArr.copy()
-    padded[8*HASH_BYTE_LENGTH + msgBitLen] = 0x1
-    padded[-1] = 0x1
+from .gf2x_packed import GF2xPoly
+from .random_utils import TRNG, make_rng
+from .utils import BitBuffer
+from .public_key import PUBLIC_KEY_CACHE
+from .cw import binary_to_constant_weight_fast
+from .metrics import stage
+from .workspace import get_workspace
+from .formats import KIND_CIPHERTEXT, pack_output
+
+
+def plaintext_constant_pad(msg, yBufferByteLength, HASH_BYTE_LENGTH, padded=None):
+    if padded is None:
+        padded = BitBuffer.zeros(yBufferByteLength)
+    else:
+        padded.data.fill(0)
+    msgByteLen = len(msg)
+
+    padded.data[HASH_BYTE_LENGTH:HASH_BYTE_LENGTH + msgByteLen] = np.frombuffer(msg, dtype=np.uint8)
+    padded.data[HASH_BYTE_LENGTH + msgByteLen] = 0x80
+    padded.data[-1] |= 0x1
 
     return padded
 
 
-def encrypt(pk, informationWord, encodedError, leda):
-    codeword = np.zeros(leda.N0*leda.P, dtype=bool)
-    codeword[:leda.K] = informationWord.copy()
-
+# Writes the ciphertext bits into codeword (N0*P bools) and returns it
+def encrypt_into(codeword, pkBlocks, informationWord, encodedError, leda):
+    parity = GF2xPoly.zero(leda.P)
     for i in range(leda.N0-1):
-        mul = gf2x_mod_mul(leda.getBlock(pk, i), leda.getBlock(informationWord, i))
-        codeword[leda.K:] = gf2x_mod_add(codeword[leda.K:], mul)
+        parity = parity.add(pkBlocks[i].mul(GF2xPoly.from_dense(leda.getBlock(informationWord, i)), leda.MUL_ENGINE))
 
-    for i in range(leda.N0):
-        codeword[leda.getBlockSlice(i)] = gf2x_mod_add(leda.getBlock(codeword, i), leda.getBlock(encodedError, i))
+    codeword[:leda.K] = informationWord
+    codeword[leda.K:] = parity.to_dense()
+    return np.bitwise_xor(codeword, encodedError, out=codeword)
 
-    return codeword
 
+def encrypt(pkBlocks, informationWord, encodedError, leda):
+    return encrypt_into(np.empty(leda.N0*leda.P, dtype=bool), pkBlocks, informationWord, encodedError, leda)
 
-def encode(msg, pk, leda):
-    msgArr = bytes_to_bitarray(msg)
-    pk = unpack_bytes(pk)
 
-    yBufferBitLength = leda.CONSTANT_WEIGHT_ENCODED_DATA_ACTUAL_BIT_LENGTH + leda.K
-    encodedError = None
+def kobara_imai_encode(msg, leda):
+    if 8 * len(msg) > leda.KOBARA_IMAI_MAX_PTX_BIT_LENGTH:
+        raise Exception("Message of {} bytes is longer than the {} bytes one LEDA ciphertext can carry, use the stream module for longer payloads".format(
+            len(msg), leda.KOBARA_IMAI_MAX_PTX_BIT_LENGTH // 8))
+    yBufferByteLength = (leda.CONSTANT_WEIGHT_ENCODED_DATA_ACTUAL_BIT_LENGTH + leda.K) // 8
+    yBuffer = BitBuffer(get_workspace(leda).buffer('yBuffer', (yBufferByteLength,), np.uint8))
+    retries = 0
     while True:
         secretSeed = TRNG(leda.TRNG_BYTE_LENGTH)
-        rng = RNG(secretSeed)
+        rng = make_rng(secretSeed, leda)
 
-        prngSeqByteLen = yBufferBitLength // 8 - leda.HASH_BYTE_LENGTH
-        prngSequence = bytes_to_bitarray(rng.randombytes(prngSeqByteLen))
+        prngSeqByteLen = yBufferByteLength - leda.HASH_BYTE_LENGTH
+        prngSequence = np.frombuffer(rng.randombytes(prngSeqByteLen), dtype=np.uint8)
 
-        yBuffer = plaintext_constant_pad(msgArr, yBufferBitLength, leda.HASH_BYTE_LENGTH)
+        plaintext_constant_pad(msg, yBufferByteLength, leda.HASH_BYTE_LENGTH, yBuffer)
 
-        yBuffer[8*leda.HASH_BYTE_LENGTH:] ^= prngSequence
+        yBuffer.data[leda.HASH_BYTE_LENGTH:] ^= prngSequence
 
-        yBuffer[:8*leda.HASH_BYTE_LENGTH] = leda.HASH_FUNC(yBuffer[8*leda.HASH_BYTE_LENGTH:])
+        yBuffer.data[:leda.HASH_BYTE_LENGTH] = np.frombuffer(leda.HASH_FUNC(yBuffer.data[leda.HASH_BYTE_LENGTH:]), dtype=np.uint8)
 
-        secretSeedBits = int_to_bitarray(secretSeed, leda.TRNG_BYTE_LENGTH)
-        yBuffer[:8*leda.TRNG_BYTE_LENGTH] ^= secretSeedBits[:]
+        yBuffer.data[:leda.TRNG_BYTE_LENGTH] ^= BitBuffer.from_int(secretSeed, leda.TRNG_BYTE_LENGTH).data
 
-        informationWord = np.zeros(leda.K, dtype=bool)
-        for i in range(leda.N0-1):
-            informationWord[leda.getBlockSlice(i)] = leda.getBlock(yBuffer[leda.CONSTANT_WEIGHT_ENCODED_DATA_ACTUAL_BIT_LENGTH:], i)[::-1]
-        encodedError = binary_to_constant_weight_approximate(yBuffer[:leda.CONSTANT_WEIGHT_ENCODED_DATA_ACTUAL_BIT_LENGTH], leda)
+        yBits = yBuffer.bits()
+        informationWord = yBits[leda.CONSTANT_WEIGHT_ENCODED_DATA_ACTUAL_BIT_LENGTH:].reshape(leda.N0-1, leda.P)[:, ::-1].reshape(-1)
+        encodedError = binary_to_constant_weight_fast(yBits[:leda.CONSTANT_WEIGHT_ENCODED_DATA_ACTUAL_BIT_LENGTH], leda)
 
         if encodedError is not None:
-            break
+            if leda.METRICS is not None:
+                leda.METRICS.record('encode_retries', retries)
+            return informationWord, encodedError
+        retries += 1
+
+
+def encode(msg, pk, leda):
+    with stage(leda, 'encode'):
+        with stage(leda, 'public_key'):
+            pk = PUBLIC_KEY_CACHE.get(pk, leda)
+
+        with stage(leda, 'kobara_imai_encode'):
+            informationWord, encodedError = kobara_imai_encode(msg, leda)
+
+        with stage(leda, 'encrypt'):
+            # packed straight away, so the thread's workspace buffer can hold the codeword
+            codeword = get_workspace(leda).buffer('codeword', (leda.N0*leda.P,), bool)
+            ctx = encrypt_into(codeword, pk.blocks, informationWord, encodedError, leda)
+        return pack_output(KIND_CIPHERTEXT, ctx, leda)
+
+
+def encrypt_many(pkBlocks, informationWords, encodedErrors, leda):
+    parity = np.zeros((informationWords.shape[0], leda.P), dtype=bool)
+    for i in range(leda.N0-1):
+        parity ^= pkBlocks[i].mul_dense_batch(informationWords[:, leda.getBlockSlice(i)], leda.MUL_ENGINE)
+
+    codewords = np.concatenate((informationWords, parity), axis=1)
+    return codewords ^ encodedErrors
+
+
+def encode_many(messages, pk, leda):
+    with stage(leda, 'encode_many'):
+        with stage(leda, 'public_key'):
+            pk = PUBLIC_KEY_CACHE.get(pk, leda)
+
+        informationWords = np.zeros((len(messages), leda.K), dtype=bool)
+        encodedErrors = np.zeros((len(messages), leda.N0*leda.P), dtype=bool)
+        with stage(leda, 'kobara_imai_encode'):
+            for m, msg in enumerate(messages):
+                informationWords[m], encodedErrors[m] = kobara_imai_encode(msg, leda)
 
-    ctx = encrypt(pk, informationWord, encodedError, leda)
-    return pack_bytes(ctx)
+        with stage(leda, 'encrypt_many'):
+            ctxs = encrypt_many(pk.blocks, informationWords, encodedErrors, leda)
+        return [pack_output(KIND_CIPHERTEXT, ctx, leda) for ctx in ctxs]
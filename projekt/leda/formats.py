@@ -0,0 +1,240 @@
+import mmap
+import struct
+import numpy as np
+
+from .LEDA import LEDACat
+from .gf2x_packed import GF2xPoly, byte_length
+from .utils import pack_bytes, unpack_bytes
+
+
+# Versioned record: a 24 byte header, then blockCount blocks of blockBytes bytes. Each block holds blockBits
+# bits packed big endian (the order of to_dense) and zero padded to a multiple of 8 bytes, so with records
+# stored back to back every block starts on a 64 bit word.
+FORMAT_MAGIC = b'LEDA'
+FORMAT_VERSION = 1
+# magic, version, kind, category, N0, P, block count, block bytes, block bits
+FORMAT_HEADER_FORMAT = '<4sBBBBIIII'
+FORMAT_HEADER_SIZE = struct.calcsize(FORMAT_HEADER_FORMAT)
+
+KIND_PUBLIC_KEY = 1
+KIND_PRIVATE_KEY = 2
+KIND_CIPHERTEXT = 3
+KIND_NAMES = {KIND_PUBLIC_KEY: 'public key', KIND_PRIVATE_KEY: 'private key', KIND_CIPHERTEXT: 'ciphertext'}
+
+
+# Malformed key or ciphertext bytes, raised before any decoding work
+class FormatError(Exception):
+    pass
+
+
+def block_bytes(bits):
+    return 8 * ((bits + 63) // 64)
+
+
+# (block count, bits per block) of each kind
+def record_layout(kind, leda):
+    if kind == KIND_PUBLIC_KEY:
+        return leda.N0 - 1, leda.P
+    if kind == KIND_CIPHERTEXT:
+        return leda.N0, leda.P
+    if kind == KIND_PRIVATE_KEY:
+        return 1, 8 * leda.TRNG_BYTE_LENGTH
+    raise Exception("Unknown record kind " + str(kind))
+
+
+def record_length(kind, leda):
+    count, bits = record_layout(kind, leda)
+    return FORMAT_HEADER_SIZE + count * block_bytes(bits)
+
+
+# Size of the legacy form: the raw seed, or pack_bytes of the bits with at least one byte of padding
+def legacy_length(kind, leda):
+    count, bits = record_layout(kind, leda)
+    if kind == KIND_PRIVATE_KEY:
+        return bits // 8
+    return (count * bits + 7) // 8 + 1
+
+
+class PackedRecord:
+    def __init__(self, kind, category, N0, P, blockBits, blocks):
+        self.kind = kind
+        self.category = category
+        self.N0 = N0
+        self.P = P
+        self.blockBits = blockBits
+        self.blocks = blocks
+
+    def leda(self):
+        leda = LEDACat.get(self.category, self.N0)
+        if leda.P != self.P:
+            raise FormatError("Record claims category {} N0 {} but has P={}".format(self.category, self.N0, self.P))
+        return leda
+
+    def check(self, kind, leda):
+        if self.kind != kind:
+            raise FormatError("Expected a LEDA {}, got a {}".format(KIND_NAMES[kind], KIND_NAMES.get(self.kind, 'record of kind ' + str(self.kind))))
+        if (self.N0, self.P) != (leda.N0, leda.P):
+            raise FormatError("{} is for N0={} P={}, not N0={} P={}".format(KIND_NAMES[kind].capitalize(), self.N0, self.P, leda.N0, leda.P))
+        if (self.blocks.shape[0], self.blockBits) != record_layout(kind, leda):
+            raise FormatError("{} has {} blocks of {} bits, expected {} of {}".format(
+                KIND_NAMES[kind].capitalize(), self.blocks.shape[0], self.blockBits, *record_layout(kind, leda)))
+        return self
+
+    def words(self):
+        return self.blocks.view('>u8')
+
+    def bits(self):
+        return np.unpackbits(self.blocks, axis=1, count=self.blockBits).view(bool).reshape(-1)
+
+    def polys(self):
+        n = byte_length(self.P)
+        return [GF2xPoly(int.from_bytes(block[:n], 'big') >> (-self.P % 8), self.P) for block in self.blocks]
+
+    def seed(self):
+        return self.blocks[0, :self.blockBits // 8].tobytes()
+
+
+def pack_record(kind, data, leda):
+    count, bits = record_layout(kind, leda)
+    size = block_bytes(bits)
+    out = np.zeros(FORMAT_HEADER_SIZE + count * size, dtype=np.uint8)
+    struct.pack_into(FORMAT_HEADER_FORMAT, out, 0, FORMAT_MAGIC, FORMAT_VERSION, kind, LEDACat.category(leda),
+                     leda.N0, leda.P, count, size, bits)
+    blocks = out[FORMAT_HEADER_SIZE:].reshape(count, size)
+    if kind == KIND_PRIVATE_KEY:
+        blocks[0, :bits // 8] = np.frombuffer(data, dtype=np.uint8)
+    else:
+        blocks[:, :(bits + 7) // 8] = np.packbits(np.asarray(data, dtype=bool).reshape(count, bits), axis=1)
+    return out.tobytes()
+
+
+def unpack_header(buf, offset):
+    if len(buf) - offset < FORMAT_HEADER_SIZE:
+        raise FormatError("Truncated LEDA record header")
+    magic, version, kind, category, N0, P, count, size, bits = struct.unpack_from(FORMAT_HEADER_FORMAT, buf, offset)
+    if magic != FORMAT_MAGIC:
+        raise FormatError("Not a LEDA record")
+    if version != FORMAT_VERSION:
+        raise FormatError("Unsupported LEDA record version " + str(version))
+    if size != block_bytes(bits):
+        raise FormatError("Corrupt LEDA record header")
+    return kind, category, N0, P, count, size, bits
+
+
+# Record starting at offset in buf, with blocks as a view into buf; returns the record and the offset after it
+def load_record(buf, offset=0):
+    kind, category, N0, P, count, size, bits = unpack_header(buf, offset)
+    end = offset + FORMAT_HEADER_SIZE + count * size
+    if end > len(buf):
+        raise FormatError("Truncated LEDA record")
+    blocks = np.frombuffer(buf, dtype=np.uint8, count=count * size, offset=offset + FORMAT_HEADER_SIZE).reshape(count, size)
+    return PackedRecord(kind, category, N0, P, bits, blocks), end
+
+
+# Anything starting with the magic is parsed strictly as a record, except data of exactly the legacy
+# length, which cannot be a record of the same kind and parameters
+def is_record(data, kind, leda):
+    return isinstance(data, PackedRecord) or (
+        isinstance(data, (bytes, bytearray, memoryview)) and len(data) != legacy_length(kind, leda) and bytes(data[:4]) == FORMAT_MAGIC)
+
+
+# data as a checked record, or None when it is in the legacy pack_bytes / raw seed form
+def parse_record(data, kind, leda):
+    if not is_record(data, kind, leda):
+        return None
+    if isinstance(data, PackedRecord):
+        return data.check(kind, leda)
+    record, end = load_record(data)
+    record.check(kind, leda)
+    if end != len(data):
+        raise FormatError("{} trailing bytes after the LEDA {}".format(len(data) - end, KIND_NAMES[kind]))
+    return record
+
+
+# Dense bits (public key, ciphertext) or seed bytes (private key) of the legacy form, with its length checked
+def legacy_input(kind, data, leda):
+    expected = legacy_length(kind, leda)
+    if len(data) != expected:
+        raise FormatError("Expected a LEDA {} of {} bytes, got {}".format(KIND_NAMES[kind], expected, len(data)))
+    if kind == KIND_PRIVATE_KEY:
+        return bytes(data)
+    count, bits = record_layout(kind, leda)
+    try:
+        unpacked = unpack_bytes(data)
+    except Exception:
+        raise FormatError("Invalid padding in LEDA " + KIND_NAMES[kind]) from None
+    if unpacked.shape[0] != count * bits:
+        raise FormatError("LEDA {} holds {} bits, expected {}".format(KIND_NAMES[kind], unpacked.shape[0], count * bits))
+    return unpacked
+
+
+# Bits of a record or legacy input of the given kind
+def input_bits(data, kind, leda):
+    record = parse_record(data, kind, leda)
+    return legacy_input(kind, data, leda) if record is None else record.bits()
+
+
+def ciphertext_bits(ctx, leda):
+    return input_bits(ctx, KIND_CIPHERTEXT, leda)
+
+
+def legacy_output(kind, data, leda):
+    if kind == KIND_PRIVATE_KEY:
+        return data
+    return pack_bytes(data)
+
+
+FORMATS = {
+    'legacy': legacy_output,
+    'v1': pack_record
+}
+DEFAULT_FORMAT = 'legacy'
+
+
+def get_format(name):
+    if name not in FORMATS:
+        raise Exception("Unknown output format " + str(name) + ", expected one of: " + ", ".join(FORMATS))
+    return FORMATS[name]
+
+
+# Serializes dense bits (public key, ciphertext) or seed bytes (private key) in leda's FORMAT
+def pack_output(kind, data, leda):
+    return get_format(leda.FORMAT)(kind, data, leda)
+
+
+def iter_records(buf):
+    offset = 0
+    while offset < len(buf):
+        record, offset = load_record(buf, offset)
+        yield record
+
+
+# All records of buf, which must share one kind and parameter set. Headers are checked with one array
+# comparison and every record's blocks are a view into a single (count, blocks, blockBytes) array.
+def load_records(buf, kind, leda):
+    if len(buf) == 0:
+        return []
+    first, size = load_record(buf)
+    first.check(kind, leda)
+    if len(buf) % size != 0:
+        raise FormatError("File size is not a multiple of the {} byte record size".format(size))
+    records = np.frombuffer(buf, dtype=np.uint8).reshape(-1, size)
+    if not (records[:, :FORMAT_HEADER_SIZE] == records[0, :FORMAT_HEADER_SIZE]).all():
+        raise FormatError("Records differ in kind or parameters")
+    blocks = records[:, FORMAT_HEADER_SIZE:].reshape(records.shape[0], first.blocks.shape[0], first.blocks.shape[1])
+    return [PackedRecord(kind, first.category, first.N0, first.P, first.blockBits, b) for b in blocks]
+
+
+def map_file(path):
+    with open(path, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_records(path, kind, leda):
+    return load_records(map_file(path), kind, leda)
+
+
+def read_ciphertexts(path, leda):
+    return read_records(path, KIND_CIPHERTEXT, leda)
@@ -69,6 +69,27 @@ def gf2x_mod_add_sparse(APosOnes, BPosOnes, sizeR, INVALID_POS_VALUE):
     return RPosOnes
 
 
+def gf2x_sparse_valid(APosOnes, INVALID_POS_VALUE):
+    APosOnes = np.asarray(APosOnes).astype(np.int64)
+    return APosOnes[APosOnes != INVALID_POS_VALUE]
+
+
+def gf2x_sparse_parity(positions):
+    values, counts = np.unique(positions, return_counts=True)
+    return values[counts % 2 == 1]
+
+
+# Index-array counterparts of gf2x_mod_mul_sparse/gf2x_mod_add_sparse: sorted positions, no padding
+def gf2x_mod_mul_sparse_idx(APosOnes, BPosOnes, INVALID_POS_VALUE):
+    A = gf2x_sparse_valid(APosOnes, INVALID_POS_VALUE)
+    B = gf2x_sparse_valid(BPosOnes, INVALID_POS_VALUE)
+    return gf2x_sparse_parity(((A.reshape(-1, 1) + B.reshape(1, -1)) % INVALID_POS_VALUE).reshape(-1))
+
+
+def gf2x_mod_add_sparse_idx(APosOnes, BPosOnes, INVALID_POS_VALUE):
+    return np.setxor1d(gf2x_sparse_valid(APosOnes, INVALID_POS_VALUE), gf2x_sparse_valid(BPosOnes, INVALID_POS_VALUE))
+
+
 def left_bit_shift(A):
     A = np.roll(A, -1)
     A[-1] = 0
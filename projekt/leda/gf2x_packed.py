@@ -0,0 +1,312 @@
+import functools
+import numpy as np
+
+
+@functools.lru_cache(maxsize=None)
+def bit_reverse_table():
+    return bytes(int('{:08b}'.format(i)[::-1], 2) for i in range(256))
+
+
+def byte_length(P):
+    return (P + 7) // 8
+
+
+def set_bits_mask(v, P):
+    return np.unpackbits(np.frombuffer(v.to_bytes(byte_length(P), 'little'), dtype=np.uint8), bitorder='little')[:P]
+
+
+def set_bit_positions(v, P):
+    return np.flatnonzero(set_bits_mask(v, P))
+
+
+def fold(v, P):
+    mask = (1 << P) - 1
+    while v >> P:
+        v = (v & mask) ^ (v >> P)
+    return v
+
+
+def mul_shift(a, b, n):
+    acc = 0
+    for i in set_bit_positions(a, n).tolist():
+        acc ^= b << i
+    return acc
+
+
+def comb_table(b, w):
+    T = [0] * (1 << w)
+    for j in range(1, 1 << w):
+        T[j] = (T[j >> 1] << 1) ^ (b if j & 1 else 0)
+    return T
+
+
+def mul_comb(a, b, n):
+    T = comb_table(b, 8)
+    acc = 0
+    for k, window in enumerate(a.to_bytes(byte_length(n), 'little')):
+        if window:
+            acc ^= T[window] << (8*k)
+    return acc
+
+
+KARATSUBA_THRESHOLD = 4096
+
+
+def mul_karatsuba(a, b, n):
+    if n <= KARATSUBA_THRESHOLD:
+        return mul_comb(a, b, n)
+    h = byte_length(n // 2) * 8
+    mask = (1 << h) - 1
+    a0, a1 = a & mask, a >> h
+    b0, b1 = b & mask, b >> h
+    p0 = mul_karatsuba(a0, b0, h)
+    p2 = mul_karatsuba(a1, b1, n - h)
+    p1 = mul_karatsuba(a0 ^ a1, b0 ^ b1, h) ^ p0 ^ p2
+    return (p2 << (2*h)) ^ (p1 << h) ^ p0
+
+
+MUL_ENGINES = {
+    'shift': mul_shift,
+    'comb': mul_comb,
+    'karatsuba': mul_karatsuba
+}
+
+DEFAULT_MUL_ENGINE = 'comb'
+
+
+def get_mul_engine(name):
+    if name not in MUL_ENGINES:
+        raise Exception("Unknown multiplication engine '{}', expected one of: {}".format(name, ", ".join(MUL_ENGINES)))
+    return MUL_ENGINES[name]
+
+
+BITSLICE_LANES = 64
+BITSLICE_WINDOW = 4
+BITSLICE_MIN_BATCH = 8
+
+
+# Multiplies a by up to 64 operands at once: bit m of word C[i] is the coefficient of x^i in operand m
+def mul_bitsliced(a, C, P):
+    w = BITSLICE_WINDOW
+    T = np.zeros((1 << w, 2*P), dtype=np.uint64)
+    for t in range(w):
+        T[1 << t:2 << t, :P] = T[:1 << t, :P] ^ np.roll(C, t)
+    T[:, P:] = T[:, :P]
+
+    windowCount = (P + w - 1) // w
+    bits = np.zeros(windowCount * w, dtype=np.int64)
+    bits[:P] = set_bits_mask(a, P)
+    windows = (bits.reshape(windowCount, w) << np.arange(w)).sum(axis=1)
+
+    res = np.zeros(P, dtype=np.uint64)
+    for k in np.flatnonzero(windows).tolist():
+        s = (k * w) % P
+        res ^= T[windows[k], P - s:2*P - s]
+    return res
+
+
+def dense_to_bitsliced(Denses):
+    P = Denses.shape[1]
+    lanes = np.zeros((P, BITSLICE_LANES // 8), dtype=np.uint8)
+    packed = np.packbits(Denses[:, ::-1].T, axis=1, bitorder='little')
+    lanes[:, :packed.shape[1]] = packed
+    return lanes.view('<u8').reshape(P)
+
+
+def bitsliced_to_dense(C, count):
+    P = C.shape[0]
+    bits = np.unpackbits(C.view(np.uint8).reshape(P, BITSLICE_LANES // 8), axis=1, bitorder='little')
+    return bits[:, :count].T[:, ::-1].astype(bool)
+
+
+def inv_binary(a, P, mul):
+    mask = (1 << P) - 1
+    maskExt = (1 << (P + 1)) - 1
+    topBit = 1 << P
+
+    u = 1
+    v = 0
+    s = topBit | 1
+    r = a
+    delta = 0
+
+    for _ in range(2*P):
+        if r & topBit == 0:
+            r = (r << 1) & maskExt
+            u = ((u << 1) & mask) | (u >> (P - 1))
+            delta += 1
+        else:
+            if s & topBit:
+                s ^= r
+                v ^= u
+
+            s = (s << 1) & maskExt
+
+            if delta == 0:
+                r, s = s, r
+                u, v = v, u
+                u = ((u << 1) & mask) | (u >> (P - 1))
+                delta = 1
+            else:
+                u = (u >> 1) | ((u & 1) << (P - 1))
+                delta -= 1
+    return u
+
+
+@functools.lru_cache(maxsize=None)
+def multiplicative_order_of_two(P):
+    order = 1
+    power = 2 % P
+    while power != 1:
+        power = power * 2 % P
+        order += 1
+    return order
+
+
+@functools.lru_cache(maxsize=64)
+def square_power_permutation(P, n):
+    # (sum a_i x^i)^(2^n) = sum a_i x^(i*2^n mod P)
+    return np.arange(P, dtype=np.int64) * pow(2, n, P) % P
+
+
+def square_power(a, P, n):
+    bits = np.unpackbits(np.frombuffer(a.to_bytes(byte_length(P), 'little'), dtype=np.uint8), bitorder='little')
+    out = np.zeros(byte_length(P) * 8, dtype=np.uint8)
+    out[square_power_permutation(P, n)] = bits[:P]
+    return int.from_bytes(np.packbits(out, bitorder='little').tobytes(), 'little')
+
+
+def inv_itoh_tsujii(a, P, mul):
+    # units of GF(2)[x]/(x^P - 1) have exponent 2^d - 1, d = ord_P(2), so a^-1 = (a^(2^(d-1) - 1))^2
+    k = multiplicative_order_of_two(P) - 1
+    beta = a
+    m = 1
+    for bit in bin(k)[3:]:
+        beta = fold(mul(square_power(beta, P, m), beta, P), P)
+        m *= 2
+        if bit == '1':
+            beta = fold(mul(square_power(beta, P, 1), a, P), P)
+            m += 1
+    return square_power(beta, P, 1)
+
+
+INV_ENGINES = {
+    'binary': inv_binary,
+    'itoh_tsujii': inv_itoh_tsujii
+}
+
+DEFAULT_INV_ENGINE = 'itoh_tsujii'
+
+
+def get_inv_engine(name):
+    if name not in INV_ENGINES:
+        raise Exception("Unknown inversion engine '{}', expected one of: {}".format(name, ", ".join(INV_ENGINES)))
+    return INV_ENGINES[name]
+
+
+class NotInvertibleError(Exception):
+    pass
+
+
+# Element of GF(2)[x]/(x^P - 1) packed into a Python int, bit k holding the coefficient of x^k
+class GF2xPoly:
+    __slots__ = ('v', 'P')
+
+    def __init__(self, v, P):
+        self.v = v
+        self.P = P
+
+    @staticmethod
+    def zero(P):
+        return GF2xPoly(0, P)
+
+    @staticmethod
+    def one(P):
+        return GF2xPoly(1, P)
+
+    @staticmethod
+    def from_dense(A):
+        P = A.shape[0]
+        return GF2xPoly(int.from_bytes(np.packbits(A).tobytes(), 'big') >> (-P % 8), P)
+
+    @staticmethod
+    def from_sparse(posOnes, P):
+        v = 0
+        for p in np.asarray(posOnes).astype(np.int64).tolist():
+            if p != P:
+                v ^= 1 << p
+        return GF2xPoly(v, P)
+
+    def to_dense(self):
+        raw = (self.v << (-self.P % 8)).to_bytes(byte_length(self.P), 'big')
+        return np.unpackbits(np.frombuffer(raw, dtype=np.uint8))[:self.P].astype(bool)
+
+    def to_sparse(self):
+        return set_bit_positions(self.v, self.P).astype(np.int32)
+
+    def weight(self):
+        return bin(self.v).count('1')
+
+    def is_zero(self):
+        return self.v == 0
+
+    def copy(self):
+        return GF2xPoly(self.v, self.P)
+
+    def __eq__(self, other):
+        return isinstance(other, GF2xPoly) and self.P == other.P and self.v == other.v
+
+    def __hash__(self):
+        return hash((self.v, self.P))
+
+    def __xor__(self, other):
+        return self.add(other)
+
+    def add(self, other):
+        return GF2xPoly(self.v ^ other.v, self.P)
+
+    def rotate(self, k):
+        k %= self.P
+        if k == 0:
+            return self.copy()
+        return GF2xPoly(((self.v << k) & ((1 << self.P) - 1)) | (self.v >> (self.P - k)), self.P)
+
+    def transpose(self):
+        n = byte_length(self.P)
+        rev = int.from_bytes(self.v.to_bytes(n, 'little').translate(bit_reverse_table()), 'big') >> (8*n - self.P)
+        return GF2xPoly(rev, self.P).rotate(1)
+
+    def mul(self, other, engine=DEFAULT_MUL_ENGINE):
+        return GF2xPoly(fold(get_mul_engine(engine)(self.v, other.v, self.P), self.P), self.P)
+
+    # Rows of Denses use the bool-array layout of gf2x.py, the result has one row per operand
+    def mul_dense_batch(self, Denses, engine=DEFAULT_MUL_ENGINE):
+        res = np.zeros(Denses.shape, dtype=bool)
+        for start in range(0, Denses.shape[0], BITSLICE_LANES):
+            chunk = Denses[start:start + BITSLICE_LANES]
+            if chunk.shape[0] < BITSLICE_MIN_BATCH:
+                for m in range(chunk.shape[0]):
+                    res[start + m] = self.mul(GF2xPoly.from_dense(chunk[m]), engine).to_dense()
+            else:
+                res[start:start + chunk.shape[0]] = bitsliced_to_dense(mul_bitsliced(self.v, dense_to_bitsliced(chunk), self.P), chunk.shape[0])
+        return res
+
+    # One shift and XOR per position on the packed int, folded once at the end; INVALID_POS_VALUE (= P) padding is dropped up front
+    def mul_sparse(self, posOnes):
+        posOnes = np.asarray(posOnes)
+        v = self.v
+        acc = 0
+        for p in posOnes[posOnes < self.P].tolist():
+            acc ^= v << p
+        return GF2xPoly(fold(acc, self.P), self.P)
+
+    def square_power(self, n):
+        return GF2xPoly(square_power(self.v, self.P, n), self.P)
+
+    def inverse(self, engine=DEFAULT_INV_ENGINE, mulEngine=DEFAULT_MUL_ENGINE):
+        if self.weight() % 2 == 0:
+            raise NotInvertibleError("Polynomial of even weight is not invertible modulo x^P - 1")
+        inv = GF2xPoly(get_inv_engine(engine)(self.v, self.P, get_mul_engine(mulEngine)), self.P)
+        if self.mul(inv, mulEngine).v != 1:
+            raise NotInvertibleError("Polynomial is not invertible modulo x^P - 1")
+        return inv
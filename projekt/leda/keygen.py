@@ -1,25 +1,13 @@
-from random_utils import TRNG, RNG
-from gf2x import gf2x_mod_mul_sparse, gf2x_mod_add_sparse, gf2x_mod_inverse, gf2x_mod_mul_dense_to_sparse, gf2x_transpose
+from .random_utils import TRNG, make_rng
+from .gf2x import gf2x_mod_mul_sparse_idx, gf2x_mod_add_sparse_idx
+from .gf2x_packed import GF2xPoly, NotInvertibleError
 import numpy as np
-from utils import pack_bytes
+from .formats import KIND_PRIVATE_KEY, KIND_PUBLIC_KEY, pack_output
+from .metrics import stage
 
 
 def randCirculantSparseBlock(countOnes, rng, maxIndex):
-    r = np.zeros(countOnes)
-
-    placedOnes = 0
-    duplicated = False
-    while placedOnes < countOnes:
-        p = rng.randrange(maxIndex)
-        duplicated = False
-        for j in range(placedOnes):
-            if r[j] == p:
-                duplicated = True
-        if not duplicated:
-            r[placedOnes] = p
-            placedOnes += 1
-
-    return r
+    return rng.sample_positions(countOnes, maxIndex)
 
 
 def generateHPosOnes(rng, leda):
@@ -34,7 +22,7 @@ def generateHPosOnes(rng, leda):
 
 
 def generateQPosOnes(rng, leda):
-    Q = np.zeros((leda.N0, leda.M))
+    Q = np.zeros((leda.N0, leda.M), dtype=np.int32)
 
     for i in range(leda.N0):
         placed_ones = 0
@@ -50,12 +38,13 @@ def calcLPosOnes(HPosOnes, QPosOnes, leda):
     LPosOnes = np.ones((leda.N0, leda.DV * leda.M), dtype=np.int32) * leda.P
     processedQOnes = [0] * leda.N0
     for i in range(leda.N0):
+        row = np.zeros(0, dtype=np.int64)
         for j in range(leda.N0):
             countOnesQji = leda.q_block_weight(j, i)
-            mul = gf2x_mod_mul_sparse(HPosOnes[j, :], QPosOnes[j, processedQOnes[j]:processedQOnes[j] + countOnesQji], leda.P)
-            prod = gf2x_mod_add_sparse(LPosOnes[i, :], mul, leda.DV * leda.M, leda.P)
-            LPosOnes[i, :] = prod
+            mul = gf2x_mod_mul_sparse_idx(HPosOnes[j, :], QPosOnes[j, processedQOnes[j]:processedQOnes[j] + countOnesQji], leda.P)
+            row = gf2x_mod_add_sparse_idx(row, mul, leda.P)
             processedQOnes[j] += countOnesQji
+        LPosOnes[i, :row.shape[0]] = row
     return LPosOnes
 
 
@@ -68,22 +57,34 @@ def sparseToDense(sparse, leda):
 
 
 def keygen(leda):
-    #TRNG
-    rndPrivateMatricesSeed = TRNG(leda.TRNG_BYTE_LENGTH)
-    rng = RNG(rndPrivateMatricesSeed)
-
-    # Generate H, Q
-    HPosOnes, _ = generateHPosOnes(rng, leda)
-    QPosOnes = generateQPosOnes(rng, leda)
-
-    # L
-    LPosOnes = calcLPosOnes(HPosOnes, QPosOnes, leda)
-    Ln0Dense = sparseToDense(LPosOnes[leda.N0-1, :], leda)
-    Ln0Inv = gf2x_mod_inverse(Ln0Dense)
-
-    M = np.zeros(leda.K, dtype=bool)
-    for i in range(leda.N0-1):
-        M[leda.getBlockSlice(i)] = gf2x_mod_mul_dense_to_sparse(Ln0Inv, LPosOnes[i, :], leda)
-        M[leda.getBlockSlice(i)] = gf2x_transpose(leda.getBlock(M, i))
-
-    return rndPrivateMatricesSeed.to_bytes(leda.TRNG_BYTE_LENGTH, "big"), pack_bytes(M)
\ No newline at end of file
+    with stage(leda, 'keygen'):
+        retries = 0
+        while True:
+            #TRNG
+            rndPrivateMatricesSeed = TRNG(leda.TRNG_BYTE_LENGTH)
+            rng = make_rng(rndPrivateMatricesSeed, leda)
+
+            # Generate H, Q
+            HPosOnes, _ = generateHPosOnes(rng, leda)
+            QPosOnes = generateQPosOnes(rng, leda)
+
+            # L
+            with stage(leda, 'calcLPosOnes'):
+                LPosOnes = calcLPosOnes(HPosOnes, QPosOnes, leda)
+            try:
+                with stage(leda, 'inverse'):
+                    Ln0Inv = GF2xPoly.from_sparse(LPosOnes[leda.N0-1, :], leda.P).inverse(leda.INV_ENGINE, leda.MUL_ENGINE)
+                break
+            except NotInvertibleError:
+                retries += 1
+                continue
+
+        if leda.METRICS is not None:
+            leda.METRICS.record('keygen_retries', retries)
+
+        M = np.zeros(leda.K, dtype=bool)
+        for i in range(leda.N0-1):
+            M[leda.getBlockSlice(i)] = Ln0Inv.mul_sparse(LPosOnes[i, :]).transpose().to_dense()
+
+        sk = rndPrivateMatricesSeed.to_bytes(leda.TRNG_BYTE_LENGTH, "big")
+        return pack_output(KIND_PRIVATE_KEY, sk, leda), pack_output(KIND_PUBLIC_KEY, M, leda)
\ No newline at end of file
@@ -0,0 +1,136 @@
+import atexit
+import collections
+import random
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from .keygen import keygen
+
+
+def keypool_worker_init():
+    # forked workers start from the parent's generator state and would all produce the same keys
+    random.seed()
+
+
+# Keeps up to `size` ready (sk, pk) pairs for one parameter set, generated in background processes.
+# Once the pool holds `lowWatermark` pairs or fewer (counting ones in flight) it is refilled to `size`.
+# A keygen error pauses refilling until get has raised it, so a persistent error is not retried in a loop.
+class KeyPool:
+    def __init__(self, leda, size=16, lowWatermark=None, workers=1):
+        if size < 1:
+            raise Exception("Key pool size must be at least 1")
+        self.leda = leda
+        self.size = size
+        self.lowWatermark = size // 2 if lowWatermark is None else lowWatermark
+        self.ready = collections.deque()
+        self.inflight = 0
+        self.served = 0
+        self.waited = 0
+        self.closed = False
+        self.error = None
+        self.condition = threading.Condition()
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=keypool_worker_init)
+        self.refiller = threading.Thread(target=self.refill, daemon=True)
+        self.refiller.start()
+
+    def needs_refill(self):
+        return self.closed or (self.error is None and len(self.ready) + self.inflight <= self.lowWatermark)
+
+    # Submitting to the process pool can take milliseconds, so it happens here instead of in get
+    def refill(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(self.needs_refill)
+                if self.closed:
+                    return
+                count = self.size - len(self.ready) - self.inflight
+                self.inflight += count
+            for _ in range(count):
+                self.executor.submit(keygen, self.leda).add_done_callback(self.generated)
+
+    def generated(self, future):
+        with self.condition:
+            self.inflight -= 1
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self.error = future.exception()
+            else:
+                self.ready.append(future.result())
+            self.condition.notify_all()
+
+    def get(self, timeout=None):
+        with self.condition:
+            if self.closed:
+                raise Exception("Key pool is closed")
+            if not self.ready:
+                self.waited += 1
+                self.condition.notify_all()
+                if not self.condition.wait_for(lambda: self.ready or self.error is not None, timeout):
+                    raise TimeoutError("No keypair was ready within {} seconds".format(timeout))
+                if not self.ready:
+                    error, self.error = self.error, None
+                    self.condition.notify_all()
+                    raise error
+            pair = self.ready.popleft()
+            self.served += 1
+            if self.needs_refill():
+                self.condition.notify_all()
+            return pair
+
+    def __len__(self):
+        with self.condition:
+            return len(self.ready)
+
+    def stats(self):
+        with self.condition:
+            return {'ready': len(self.ready), 'inflight': self.inflight, 'served': self.served, 'waited': self.waited,
+                    'size': self.size, 'lowWatermark': self.lowWatermark}
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.ready.clear()
+            self.condition.notify_all()
+        self.refiller.join()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+KEY_POOLS = {}
+KEY_POOLS_LOCK = threading.Lock()
+
+
+def pool_key(leda):
+    return (leda.N0, leda.P, leda.DRBG, leda.INV_ENGINE, leda.MUL_ENGINE, leda.FORMAT)
+
+
+# The pool for leda's parameter set, created with the given options on first use
+def get_key_pool(leda, **options):
+    with KEY_POOLS_LOCK:
+        pool = KEY_POOLS.get(pool_key(leda))
+        if pool is None or pool.closed:
+            pool = KeyPool(leda, **options)
+            KEY_POOLS[pool_key(leda)] = pool
+        return pool
+
+
+def pooled_keygen(leda, timeout=None):
+    return get_key_pool(leda).get(timeout)
+
+
+def close_key_pools():
+    with KEY_POOLS_LOCK:
+        pools = list(KEY_POOLS.values())
+        KEY_POOLS.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_key_pools)
@@ -0,0 +1,120 @@
+import os
+import struct
+import numpy as np
+
+from .private_key import ExpandedPrivateKey, expand_private_key, seed_to_bytes
+from .decode import qt_row_blocks, bf_decoding_tables
+
+
+KEYSTORE_MAGIC = b'LEDAKS01'
+# magic, DRBG name, N0, P, DV, M, seed bytes, record bytes
+KEYSTORE_HEADER_FORMAT = '<8s16sIIIIII'
+KEYSTORE_HEADER_SIZE = 64
+
+
+# One fixed-size record per key, int32 little endian; flipOffsets rows are padded, flipOffsetCounts holds their lengths
+def record_dtype(leda):
+    return np.dtype([
+        ('seed', 'u1', (leda.TRNG_BYTE_LENGTH,)),
+        ('H', '<i4', (leda.N0, leda.DV)),
+        ('HT', '<i4', (leda.N0, leda.DV)),
+        ('Q', '<i4', (leda.N0, leda.M)),
+        ('QT', '<i4', (leda.N0, leda.M)),
+        ('L', '<i4', (leda.N0, leda.DV * leda.M)),
+        ('flipOffsetCounts', '<i4', (leda.N0,)),
+        ('flipOffsets', '<i4', (leda.N0, leda.DV * leda.M))
+    ])
+
+
+def keystore_header(leda, recordSize):
+    header = struct.pack(KEYSTORE_HEADER_FORMAT, KEYSTORE_MAGIC, leda.DRBG.encode(), leda.N0, leda.P, leda.DV, leda.M,
+                         leda.TRNG_BYTE_LENGTH, recordSize)
+    return header.ljust(KEYSTORE_HEADER_SIZE, b'\0')
+
+
+# Append-only file of expanded private keys for one parameter set, read through np.memmap so processes
+# opening the same file share the page cache. A single process should append at a time.
+class KeyStore:
+    def __init__(self, path, leda):
+        self.path = path
+        self.leda = leda
+        self.dtype = record_dtype(leda)
+        header = keystore_header(leda, self.dtype.itemsize)
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(header)
+        else:
+            with open(path, 'rb') as f:
+                stored = f.read(KEYSTORE_HEADER_SIZE)
+            if stored[:8] != KEYSTORE_MAGIC:
+                raise Exception("Not a LEDA keystore: " + path)
+            if stored != header:
+                raise Exception("Keystore " + path + " was written for different LEDA parameters or DRBG")
+
+        self.QTBlocks = qt_row_blocks(leda)
+        self.mapping = None
+        self.records = None
+        self.index = {}
+        self.refresh()
+
+    def refresh(self):
+        count = (os.path.getsize(self.path) - KEYSTORE_HEADER_SIZE) // self.dtype.itemsize
+        if count == len(self.index):
+            return
+        self.mapping = np.memmap(self.path, dtype=self.dtype, mode='r', offset=KEYSTORE_HEADER_SIZE, shape=(count,))
+        # plain ndarray over the same mapping, memmap subclass views are noticeably slower to slice
+        self.records = self.mapping.view(np.ndarray)
+        seeds = self.records['seed']
+        self.index = {seeds[i].tobytes(): i for i in range(count)}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, sk):
+        return seed_to_bytes(sk, self.leda) in self.index
+
+    def seeds(self):
+        return list(self.index)
+
+    def add(self, sk):
+        key = sk if isinstance(sk, ExpandedPrivateKey) else expand_private_key(sk, self.leda)
+        self.refresh()
+        if key.seed in self.index:
+            return
+        _, flipOffsets = bf_decoding_tables(key.HT, key.QT, self.leda)
+
+        record = np.zeros(1, dtype=self.dtype)
+        record['seed'][0] = np.frombuffer(key.seed, dtype=np.uint8)
+        for name in ('H', 'HT', 'Q', 'QT', 'L'):
+            record[name][0] = getattr(key, name)
+        for i, offsets in enumerate(flipOffsets):
+            record['flipOffsetCounts'][0, i] = offsets.shape[0]
+            record['flipOffsets'][0, i, :offsets.shape[0]] = offsets
+
+        with open(self.path, 'ab') as f:
+            f.write(record.tobytes())
+        self.refresh()
+
+    # Returns the key as read-only views into the mapped file, or None when the seed is not stored
+    def get(self, sk):
+        seed = seed_to_bytes(sk, self.leda)
+        if seed not in self.index:
+            self.refresh()
+            if seed not in self.index:
+                return None
+        i = self.index[seed]
+        r = self.records
+        key = ExpandedPrivateKey(seed, r['H'][i], r['HT'][i], r['Q'][i], r['QT'][i], r['L'][i])
+        counts = r['flipOffsetCounts'][i].tolist()
+        key.tables['bf'] = (self.QTBlocks, [r['flipOffsets'][i, j, :counts[j]] for j in range(self.leda.N0)])
+        return key
+
+
+OPEN_KEYSTORES = {}
+
+
+def open_keystore(path, leda):
+    storeKey = (os.path.abspath(path), leda.N0, leda.P, leda.DRBG)
+    if storeKey not in OPEN_KEYSTORES:
+        OPEN_KEYSTORES[storeKey] = KeyStore(path, leda)
+    return OPEN_KEYSTORES[storeKey]
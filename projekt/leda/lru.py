@@ -0,0 +1,39 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def lookup(self, cacheKey, build):
+        with self.lock:
+            value = self.entries.get(cacheKey)
+            if value is not None:
+                self.entries.move_to_end(cacheKey)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = build()
+        if self.maxsize > 0:
+            with self.lock:
+                self.entries[cacheKey] = value
+                self.entries.move_to_end(cacheKey)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'maxsize': self.maxsize}
@@ -1,10 +1,160 @@
-from keygen import keygen
-from encode import encode
-from decode import decode
-from LEDA import LEDACat
+import argparse
+import binascii
+import contextlib
+import os
+import sys
+import time
+
+from .LEDA import LEDACat
+
+# Only argparse and the parameter tables are imported up front; numpy and the LEDA modules are imported
+# by the subcommand that needs them, so --help and argument errors return immediately.
+
+RECORD_BATCH = 64
+
+
+# '-' stands for stdin/stdout, which are left open
+def opened(path, mode, std):
+    return contextlib.nullcontext(std) if path == '-' else open(path, mode)
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+# Batches of (ok, record or error message); a line that is not valid base64 fails on its own
+def record_batches(lines, decodeLine):
+    batch = []
+    for line in lines:
+        try:
+            batch.append((True, decodeLine(line.rstrip(b'\r\n'))))
+        except binascii.Error as e:
+            batch.append((False, "invalid base64: " + str(e)))
+        if len(batch) == RECORD_BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Runs in a pool process: service_batch over the records that were read, failed lines kept in place
+def record_batch(op, key, batch):
+    from .service import service_batch
+
+    records = [value for ok, value in batch if ok]
+    results = iter(service_batch(op, key, records) if records else [])
+    return [next(results) if ok else (ok, value) for ok, value in batch]
+
+
+# Encodes (decodes) every line of src with one LEDA ciphertext per record, in batches spread over worker
+# processes. Returns the number of records that failed.
+def process_records(op, key, src, dst, leda, workers):
+    import base64
+    from concurrent.futures import ProcessPoolExecutor
+    from .stream import ordered_map
+    from .service import OP_ENCODE, service_worker_init
+
+    if op == OP_ENCODE:
+        decodeLine, encodeResult = bytes, base64.b64encode
+    else:
+        decodeLine, encodeResult = base64.b64decode, bytes
+
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=service_worker_init,
+                                       initargs=(leda.configure(METRICS=None),))
+    else:
+        service_worker_init(leda)
+
+    failures = 0
+    record = 0
+    items = ((op, key, batch) for batch in record_batches(src, decodeLine))
+    with executor or contextlib.nullcontext():
+        for results in ordered_map(record_batch, items, workers, executor):
+            for ok, value in results:
+                record += 1
+                if ok:
+                    dst.write(encodeResult(value) + b'\n')
+                else:
+                    failures += 1
+                    dst.write(b'\n')
+                    print("record {}: {}".format(record, value), file=sys.stderr)
+    return failures
+
+
+# Keys with a versioned header name their own parameter set, which then overrides --category/--n0
+def key_leda(key, leda):
+    from .formats import FORMAT_MAGIC, load_record
+
+    if not key.startswith(FORMAT_MAGIC):
+        return leda
+    try:
+        record, _ = load_record(key)
+    except Exception:
+        return leda
+    return record.leda().configure(FORMAT=leda.FORMAT)
+
+
+def cmd_keygen(args, leda):
+    from .keygen import keygen
+
+    sk, pk = keygen(leda)
+    write_file(args.sk, sk)
+    write_file(args.pk, pk)
+
+
+def cmd_encrypt(args, leda):
+    pk = read_file(args.pk)
+    leda = key_leda(pk, leda)
+    with opened(args.input, 'rb', sys.stdin.buffer) as src, opened(args.output, 'wb', sys.stdout.buffer) as dst:
+        if args.records:
+            from .service import OP_ENCODE
+            return 1 if process_records(OP_ENCODE, pk, src, dst, leda, args.workers) else 0
+        from .stream import encrypt_file
+        encrypt_file(src, dst, pk, leda, args.chunk_size, args.workers)
+
+
+def cmd_decrypt(args, leda):
+    sk = read_file(args.sk)
+    leda = key_leda(sk, leda)
+    with opened(args.input, 'rb', sys.stdin.buffer) as src, opened(args.output, 'wb', sys.stdout.buffer) as dst:
+        if args.records:
+            from .service import OP_DECODE
+            return 1 if process_records(OP_DECODE, sk, src, dst, leda, args.workers) else 0
+        from .stream import decrypt_file
+        decrypt_file(src, dst, sk, leda, args.workers)
+
+
+def cmd_bench(args, leda):
+    import io
+    from .keygen import keygen
+    from .service import OP_ENCODE, OP_DECODE
+
+    start = time.perf_counter()
+    sk, pk = keygen(leda)
+    print("keygen: {:.3f}s".format(time.perf_counter() - start))
+
+    records = b''.join(b'record %d\n' % i for i in range(args.records))
+    for op, key, name in ((OP_ENCODE, pk, 'encrypt'), (OP_DECODE, sk, 'decrypt')):
+        out = io.BytesIO()
+        start = time.perf_counter()
+        process_records(op, key, io.BytesIO(records), out, leda, args.workers)
+        seconds = time.perf_counter() - start
+        print("{}: {} records in {:.3f}s, {:.1f} records/s with {} worker(s)".format(name, args.records, seconds, args.records / seconds, args.workers))
+        records = out.getvalue()
+
+
+def cmd_demo(args, leda):
+    from .keygen import keygen
+    from .encode import encode
+    from .decode import decode
 
-if __name__ == '__main__':
-    leda = LEDACat.get(4, 4)
     sk, pk = keygen(leda)
     print("SK:", sk)
     print("PK:", pk)
@@ -12,4 +162,62 @@ if __name__ == '__main__':
     e = encode("AAAABBBBCCCCDDDD 1111222233334444".encode("utf-8"), pk, leda)
     print("Ciphertext:", e)
     d = decode(e, sk, leda)
-    print("Plaintext:", d.decode("utf-8"))
\ No newline at end of file
+    print("Plaintext:", d.decode("utf-8"))
+
+
+def parse_args(argv=None):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--category', type=int, default=1, help="NIST security category, 1 to 5")
+    common.add_argument('--n0', type=int, default=2, choices=(2, 3, 4))
+    common.add_argument('--format', default='v1', choices=('v1', 'legacy'),
+                        help="key and ciphertext format: v1 (versioned header) or legacy; keys in v1 also set category and n0")
+
+    streams = argparse.ArgumentParser(add_help=False)
+    streams.add_argument('-i', '--input', default='-', help="input file, '-' for stdin")
+    streams.add_argument('-o', '--output', default='-', help="output file, '-' for stdout")
+    streams.add_argument('--records', action='store_true',
+                         help="one LEDA ciphertext per input line (base64 lines on the ciphertext side) instead of one stream")
+    streams.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    parser = argparse.ArgumentParser(prog="python -m leda", description="LEDAcrypt key generation, encryption and decryption")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    keygen = commands.add_parser('keygen', parents=[common], help="generate a keypair")
+    keygen.add_argument('--sk', required=True, metavar='PATH')
+    keygen.add_argument('--pk', required=True, metavar='PATH')
+    keygen.set_defaults(run=cmd_keygen)
+
+    encrypt = commands.add_parser('encrypt', parents=[common, streams], help="encrypt a file or stream of records")
+    encrypt.add_argument('--pk', required=True, metavar='PATH')
+    encrypt.add_argument('--chunk-size', type=int, default=1 << 20, help="stream chunk size in bytes")
+    encrypt.set_defaults(run=cmd_encrypt)
+
+    decrypt = commands.add_parser('decrypt', parents=[common, streams], help="decrypt a file or stream of records")
+    decrypt.add_argument('--sk', required=True, metavar='PATH')
+    decrypt.set_defaults(run=cmd_decrypt)
+
+    bench = commands.add_parser('bench', parents=[common], help="measure record throughput")
+    bench.add_argument('--records', type=int, default=256)
+    bench.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    bench.set_defaults(run=cmd_bench)
+
+    demo = commands.add_parser('demo', parents=[common], help="print one keygen, encrypt and decrypt round trip")
+    demo.set_defaults(run=cmd_demo)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        leda = LEDACat.get(args.category, args.n0).configure(FORMAT=args.format)
+        return args.run(args, leda) or 0
+    except BrokenPipeError:
+        return 1
+    except Exception as e:
+        print("error:", e, file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+import contextlib
+import numbers
+import threading
+import time
+
+
+class Stage:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+# Running count, total, min and max of one series, plus its last value. Values that are not numbers
+# (per-iteration lists from the decoders) only update count and last. Memory stays constant however long it runs.
+class Aggregate:
+    __slots__ = ('count', 'total', 'min', 'max', 'last')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.last = None
+
+    def __getstate__(self):
+        return (self.count, self.total, self.min, self.max, self.last)
+
+    def __setstate__(self, state):
+        self.count, self.total, self.min, self.max, self.last = state
+
+    def add(self, value):
+        self.count += 1
+        self.last = value
+        if isinstance(value, numbers.Real):
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def summary(self):
+        if self.min is None:
+            return {'count': self.count, 'last': self.last}
+        return {'count': self.count, 'total': self.total, 'mean': self.total / self.count,
+                'min': self.min, 'max': self.max, 'last': self.last}
+
+
+# Collects stage wall times and per-call values as running aggregates; set it as the LEDA METRICS option
+# to enable. Subclasses can override add_time and record to forward measurements elsewhere.
+class Metrics:
+    def __init__(self):
+        self.timings = {}
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'timings': self.timings, 'values': self.values}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.timings.update(state['timings'])
+        self.values.update(state['values'])
+
+    def stage(self, name):
+        return Stage(self, name)
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            aggregate = self.timings.get(name)
+            if aggregate is None:
+                aggregate = self.timings[name] = Aggregate()
+            aggregate.add(seconds)
+
+    def record(self, name, value):
+        with self.lock:
+            aggregate = self.values.get(name)
+            if aggregate is None:
+                aggregate = self.values[name] = Aggregate()
+            aggregate.add(value)
+
+    # Most recent value recorded under name, or default
+    def last(self, name, default=None):
+        with self.lock:
+            aggregate = self.values.get(name)
+            return default if aggregate is None else aggregate.last
+
+    def reset(self):
+        with self.lock:
+            self.timings.clear()
+            self.values.clear()
+
+    def summary(self):
+        with self.lock:
+            stages = {name: {'calls': t.count, 'total': t.total, 'mean': t.total / t.count, 'min': t.min, 'max': t.max}
+                      for name, t in self.timings.items()}
+            return {'stages': stages, 'values': {name: v.summary() for name, v in self.values.items()}}
+
+
+NULL_STAGE = contextlib.nullcontext()
+
+
+def stage(leda, name):
+    if leda.METRICS is None:
+        return NULL_STAGE
+    return leda.METRICS.stage(name)
@@ -0,0 +1,78 @@
+import numpy as np
+
+from .random_utils import make_rng
+from .keygen import generateHPosOnes, generateQPosOnes, calcLPosOnes
+from .lru import LRUCache
+from .formats import KIND_PRIVATE_KEY, parse_record, legacy_input
+
+
+def transposeQPosOnes(QPosOnes, leda):
+    QT = np.zeros(QPosOnes.shape, dtype=np.int32)
+    transposed_ones_idx = np.zeros(leda.N0, dtype=np.uint32)
+    for source_row_idx in range(leda.N0):
+        currQoneIdx = 0
+        endQblockIdx = 0
+        for blockIdx in range(leda.N0):
+            endQblockIdx += leda.q_block_weight(source_row_idx, blockIdx)
+            while currQoneIdx < endQblockIdx:
+                QT[blockIdx, transposed_ones_idx[blockIdx]] = (leda.P - QPosOnes[source_row_idx, currQoneIdx]) % leda.P
+                transposed_ones_idx[blockIdx] += 1
+                currQoneIdx += 1
+    return QT
+
+
+def seed_to_bytes(sk, leda):
+    if isinstance(sk, int):
+        return sk.to_bytes(leda.TRNG_BYTE_LENGTH, byteorder='big')
+    record = parse_record(sk, KIND_PRIVATE_KEY, leda)
+    if record is not None:
+        return record.seed()
+    return legacy_input(KIND_PRIVATE_KEY, sk, leda)
+
+
+class ExpandedPrivateKey:
+    def __init__(self, seed, H, HT, Q, QT, L):
+        self.seed = seed
+        self.H = H
+        self.HT = HT
+        self.Q = Q
+        self.QT = QT
+        self.L = L
+        self.tables = {}
+        for arr in (H, HT, Q, QT, L):
+            arr.flags.writeable = False
+
+    # Decoder-specific index tables, built on first use and kept with the key
+    def table(self, name, build):
+        if name not in self.tables:
+            self.tables[name] = build(self)
+        return self.tables[name]
+
+
+def expand_private_key(sk, leda):
+    seed = seed_to_bytes(sk, leda)
+    rng = make_rng(int.from_bytes(seed, byteorder='big'), leda)
+    H, HT = generateHPosOnes(rng, leda)
+    Q = generateQPosOnes(rng, leda)
+    L = calcLPosOnes(H, Q, leda)
+    return ExpandedPrivateKey(seed, H, HT, Q, transposeQPosOnes(Q, leda), L)
+
+
+def load_private_key(sk, leda):
+    if leda.KEYSTORE is not None:
+        # keystore imports this module, so it is only pulled in once a store is configured
+        from .keystore import open_keystore
+        key = open_keystore(leda.KEYSTORE, leda).get(sk)
+        if key is not None:
+            return key
+    return expand_private_key(sk, leda)
+
+
+class PrivateKeyCache(LRUCache):
+    def get(self, sk, leda):
+        if isinstance(sk, ExpandedPrivateKey):
+            return sk
+        return self.lookup((seed_to_bytes(sk, leda), leda.N0, leda.P, leda.DRBG), lambda: load_private_key(sk, leda))
+
+
+PRIVATE_KEY_CACHE = PrivateKeyCache()
@@ -0,0 +1,36 @@
+import hashlib
+
+from .gf2x_packed import GF2xPoly
+from .lru import LRUCache
+from .formats import KIND_PUBLIC_KEY, PackedRecord, parse_record, legacy_input
+
+
+class PublicKey:
+    def __init__(self, blocks, leda):
+        self.blocks = blocks
+        self.N0 = leda.N0
+        self.P = leda.P
+
+    @staticmethod
+    def from_bits(pk, leda):
+        return PublicKey([GF2xPoly.from_dense(leda.getBlock(pk, i)) for i in range(leda.N0-1)], leda)
+
+    @staticmethod
+    def from_bytes(pk, leda):
+        record = parse_record(pk, KIND_PUBLIC_KEY, leda)
+        if record is not None:
+            return PublicKey(record.polys(), leda)
+        return PublicKey.from_bits(legacy_input(KIND_PUBLIC_KEY, pk, leda), leda)
+
+
+class PublicKeyCache(LRUCache):
+    def get(self, pk, leda):
+        if isinstance(pk, PublicKey):
+            if pk.N0 != leda.N0 or pk.P != leda.P:
+                raise Exception("Public key does not match the LEDA parameter set")
+            return pk
+        digest = hashlib.sha256(pk.blocks if isinstance(pk, PackedRecord) else pk).digest()
+        return self.lookup((digest, leda.N0, leda.P), lambda: PublicKey.from_bytes(pk, leda))
+
+
+PUBLIC_KEY_CACHE = PublicKeyCache(maxsize=32)
@@ -1,4 +1,6 @@
+import hashlib
 from random import getrandbits, Random
+import numpy as np
 
 
 def TRNG(n):
@@ -13,4 +15,88 @@ class RNG:
         return self.rng.randrange(0, stop)
 
     def randombytes(self, n):
-        return self.rng.getrandbits(n*8).to_bytes(n, byteorder='big')
\ No newline at end of file
+        return self.rng.getrandbits(n*8).to_bytes(n, byteorder='big')
+
+    def sample_positions(self, countOnes, maxIndex):
+        r = []
+        placed = set()
+        while len(r) < countOnes:
+            p = self.randrange(maxIndex)
+            if p not in placed:
+                placed.add(p)
+                r.append(p)
+        return np.array(r, dtype=np.int32)
+
+
+# SHAKE256 in counter mode: block i of the stream is SHAKE256(seed || i), consumed in order
+class ShakeDRBG:
+    BLOCK_BYTES = 4096
+
+    def __init__(self, seed):
+        if isinstance(seed, int):
+            seed = seed.to_bytes(max(1, (seed.bit_length() + 7) // 8), byteorder='big')
+        self.seed = b'LEDA-SHAKE-DRBG' + bytes(seed)
+        self.counter = 0
+        self.buffer = b''
+        self.offset = 0
+
+    def randombytes(self, n):
+        if self.offset + n > len(self.buffer):
+            blocks = [self.buffer[self.offset:]]
+            available = len(blocks[0])
+            while available < n:
+                blocks.append(hashlib.shake_256(self.seed + self.counter.to_bytes(8, byteorder='big')).digest(self.BLOCK_BYTES))
+                self.counter += 1
+                available += self.BLOCK_BYTES
+            self.buffer = b''.join(blocks)
+            self.offset = 0
+        out = self.buffer[self.offset:self.offset + n]
+        self.offset += n
+        return out
+
+    # count uniform draws below maxIndex, rejection sampled so there is no modulo bias
+    def randuint32(self, count, maxIndex):
+        limit = (1 << 32) - (1 << 32) % maxIndex
+        values = np.frombuffer(self.randombytes(4 * count), dtype='>u4')
+        return values[values < limit] % maxIndex
+
+    def randrange(self, stop):
+        while True:
+            values = self.randuint32(1, stop)
+            if values.shape[0] > 0:
+                return int(values[0])
+
+    # Candidates come 2 * countOnes at a time from one bulk draw; duplicates are dropped with a set, which for
+    # LEDA's at most DV positions per block is faster than deduplicating with np.unique
+    def sample_positions(self, countOnes, maxIndex):
+        if countOnes > maxIndex:
+            raise Exception("Cannot draw {} distinct positions below {}".format(countOnes, maxIndex))
+        r = []
+        placed = set()
+        while len(r) < countOnes:
+            for p in self.randuint32(2 * countOnes, maxIndex).tolist():
+                if p not in placed:
+                    placed.add(p)
+                    r.append(p)
+        return np.array(r[:countOnes], dtype=np.int32)
+
+
+DRBGS = {
+    'mt': RNG,
+    'shake': ShakeDRBG
+}
+
+DEFAULT_DRBG = 'mt'
+
+
+def get_drbg(name):
+    if name not in DRBGS:
+        raise Exception("Unknown DRBG '{}', expected one of: {}".format(name, ", ".join(DRBGS)))
+    return DRBGS[name]
+
+
+def make_rng(seed, leda):
+    drbg = get_drbg(leda.DRBG)
+    if drbg is not RNG and isinstance(seed, int):
+        seed = seed.to_bytes(leda.TRNG_BYTE_LENGTH, byteorder='big')
+    return drbg(seed)
@@ -0,0 +1,384 @@
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import os
+import random
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from .LEDA import LEDACat
+from .encode import encode, encode_many
+from .decode import decode
+from .private_key import PRIVATE_KEY_CACHE
+
+
+# Every message is a 4 byte length followed by the body. Requests: id, op, key length, key, data.
+# Responses: id, status, payload (result bytes, or a utf-8 error message).
+FRAME_LENGTH_FORMAT = '<I'
+REQUEST_FORMAT = '<IBI'
+RESPONSE_FORMAT = '<IB'
+MAX_FRAME_BYTES = 64 << 20
+
+OP_ENCODE = 1
+OP_DECODE = 2
+OP_STATS = 3
+OP_NAMES = {OP_ENCODE: 'encode', OP_DECODE: 'decode', OP_STATS: 'stats'}
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+LATENCY_WINDOW = 10000
+
+
+async def read_frame(reader):
+    try:
+        length, = struct.unpack(FRAME_LENGTH_FORMAT, await reader.readexactly(struct.calcsize(FRAME_LENGTH_FORMAT)))
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise
+        return None
+    if length > MAX_FRAME_BYTES:
+        raise Exception("Frame of {} bytes exceeds the {} byte limit".format(length, MAX_FRAME_BYTES))
+    return await reader.readexactly(length)
+
+
+def write_frame(writer, body):
+    writer.write(struct.pack(FRAME_LENGTH_FORMAT, len(body)) + body)
+
+
+SERVICE_WORKER_STATE = {}
+
+
+def service_worker_init(leda):
+    # forked workers start from the parent's generator state and would draw the same encryption seeds
+    random.seed()
+    SERVICE_WORKER_STATE['leda'] = leda
+
+
+def encode_batch(messages, pk, leda):
+    try:
+        return [(True, ctx) for ctx in encode_many(messages, pk, leda)]
+    except Exception:
+        # one bad message should not fail the others
+        results = []
+        for msg in messages:
+            try:
+                results.append((True, encode(msg, pk, leda)))
+            except Exception as e:
+                results.append((False, str(e)))
+        return results
+
+
+def decode_batch(ciphertexts, sk, leda):
+    key = PRIVATE_KEY_CACHE.get(sk, leda)
+    results = []
+    for ctx in ciphertexts:
+        try:
+            results.append((True, decode(ctx, key, leda)))
+        except Exception as e:
+            results.append((False, str(e)))
+    return results
+
+
+# Runs in a pool process; returns (ok, ciphertext/plaintext or error message) per item
+def service_batch(op, key, items):
+    leda = SERVICE_WORKER_STATE['leda']
+    if op == OP_ENCODE:
+        return encode_batch(items, key, leda)
+    return decode_batch(items, key, leda)
+
+
+# asyncio front end for one parameter set. Concurrent encode (decode) requests for the same public (private) key
+# are coalesced into batches of up to maxBatch items, collected for at most batchDelay seconds, and run in a
+# process pool with at most 2 * workers batches in flight. Once maxPending requests are outstanding the server
+# stops reading from connections, so clients see backpressure through their socket buffers.
+class KEMService:
+    def __init__(self, leda, workers=None, maxBatch=64, batchDelay=0.002, maxPending=1024, metrics=None):
+        self.leda = leda
+        self.workers = workers or os.cpu_count() or 1
+        self.maxBatch = maxBatch
+        self.batchDelay = batchDelay
+        self.maxPending = maxPending
+        self.metrics = metrics
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=service_worker_init,
+                                            initargs=(leda.configure(METRICS=None),))
+        self.server = None
+        self.slots = None
+        self.batchSlots = None
+        self.batches = {}
+        self.tasks = set()
+        self.handlers = set()
+        self.connections = 0
+        self.pending = 0
+        self.queuedBatches = 0
+        self.inflightBatches = 0
+        self.batchSizes = collections.deque(maxlen=LATENCY_WINDOW)
+        self.latencies = {OP_ENCODE: collections.deque(maxlen=LATENCY_WINDOW), OP_DECODE: collections.deque(maxlen=LATENCY_WINDOW)}
+        self.counts = {name: {'requests': 0, 'errors': 0} for name in OP_NAMES.values()}
+
+    async def start(self, path=None, host='127.0.0.1', port=0):
+        self.slots = asyncio.Semaphore(self.maxPending)
+        self.batchSlots = asyncio.Semaphore(2 * self.workers)
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handle_connection, path)
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self
+
+    @property
+    def address(self):
+        return self.server.sockets[0].getsockname()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for handler in list(self.handlers):
+            handler.cancel()
+        if self.handlers:
+            await asyncio.gather(*self.handlers, return_exceptions=True)
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+        return False
+
+    async def handle_connection(self, reader, writer):
+        self.connections += 1
+        self.handlers.add(asyncio.current_task())
+        responses = set()
+        try:
+            while True:
+                await self.slots.acquire()
+                try:
+                    body = await read_frame(reader)
+                except Exception:
+                    body = None
+                if body is None:
+                    self.slots.release()
+                    break
+                self.pending += 1
+                task = asyncio.create_task(self.respond(body, writer))
+                responses.add(task)
+                task.add_done_callback(responses.discard)
+        except asyncio.CancelledError:
+            # service shutdown; requests already read are still answered
+            pass
+        finally:
+            self.handlers.discard(asyncio.current_task())
+            if responses:
+                await asyncio.gather(*responses, return_exceptions=True)
+            self.connections -= 1
+            writer.close()
+
+    async def respond(self, body, writer):
+        start = time.perf_counter()
+        requestId, op = 0, 0
+        try:
+            requestId, op, keyLength = struct.unpack_from(REQUEST_FORMAT, body)
+            offset = struct.calcsize(REQUEST_FORMAT)
+            key = bytes(body[offset:offset + keyLength])
+            data = bytes(body[offset + keyLength:])
+            payload = await self.submit(op, key, data)
+            status = STATUS_OK
+        except Exception as e:
+            payload = str(e).encode()
+            status = STATUS_ERROR
+        finally:
+            self.pending -= 1
+            self.slots.release()
+
+        if op in OP_NAMES:
+            self.counts[OP_NAMES[op]]['requests'] += 1
+            if status != STATUS_OK:
+                self.counts[OP_NAMES[op]]['errors'] += 1
+        if op in self.latencies:
+            seconds = time.perf_counter() - start
+            self.latencies[op].append(seconds)
+            if self.metrics is not None:
+                self.metrics.add_time('service_' + OP_NAMES[op], seconds)
+        try:
+            write_frame(writer, struct.pack(RESPONSE_FORMAT, requestId, status) + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def submit(self, op, key, data):
+        if op == OP_STATS:
+            return json.dumps(self.stats()).encode()
+        if op not in (OP_ENCODE, OP_DECODE):
+            raise Exception("Unknown service operation " + str(op))
+
+        batchKey = (op, key)
+        batch = self.batches.get(batchKey)
+        if batch is None:
+            batch = self.batches[batchKey] = []
+            asyncio.get_running_loop().call_later(self.batchDelay, self.flush, batchKey, batch)
+        future = asyncio.get_running_loop().create_future()
+        batch.append((data, future))
+        if len(batch) >= self.maxBatch:
+            self.flush(batchKey, batch)
+        return await future
+
+    def flush(self, batchKey, batch):
+        # the delayed flush of a batch that already filled up finds a newer batch, or none, under its key
+        if self.batches.get(batchKey) is not batch:
+            return
+        del self.batches[batchKey]
+        task = asyncio.create_task(self.run_batch(batchKey[0], batchKey[1], batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run_batch(self, op, key, batch):
+        self.queuedBatches += 1
+        async with self.batchSlots:
+            self.queuedBatches -= 1
+            self.inflightBatches += 1
+            self.batchSizes.append(len(batch))
+            if self.metrics is not None:
+                self.metrics.record('service_batch_size', len(batch))
+            try:
+                results = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, service_batch, op, key, [data for data, _ in batch])
+            except Exception as e:
+                results = [(False, str(e))] * len(batch)
+            finally:
+                self.inflightBatches -= 1
+        for (ok, value), (_, future) in zip(results, batch):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(Exception(value))
+
+    def stats(self):
+        latency = {}
+        for op, samples in self.latencies.items():
+            if samples:
+                p50, p90, p99 = np.percentile(samples, (50, 90, 99)).tolist()
+                latency[OP_NAMES[op]] = {'p50': p50, 'p90': p90, 'p99': p99, 'samples': len(samples)}
+        return {
+            'connections': self.connections,
+            'pending_requests': self.pending,
+            'max_pending': self.maxPending,
+            'open_batches': len(self.batches),
+            'queued_batches': self.queuedBatches,
+            'inflight_batches': self.inflightBatches,
+            'mean_batch_size': sum(self.batchSizes) / len(self.batchSizes) if self.batchSizes else 0.0,
+            'requests': self.counts,
+            'latency': latency
+        }
+
+
+# Pipelined client: any number of requests can be awaited concurrently over one connection
+class KEMClient:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count(1)
+        self.waiting = {}
+        self.receiver = asyncio.create_task(self.receive())
+
+    @staticmethod
+    async def connect(path=None, host='127.0.0.1', port=None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return KEMClient(reader, writer)
+
+    async def receive(self):
+        error = Exception("Connection to the KEM service closed")
+        try:
+            while True:
+                body = await read_frame(self.reader)
+                if body is None:
+                    break
+                requestId, status = struct.unpack_from(RESPONSE_FORMAT, body)
+                payload = body[struct.calcsize(RESPONSE_FORMAT):]
+                future = self.waiting.pop(requestId, None)
+                if future is None or future.done():
+                    continue
+                if status == STATUS_OK:
+                    future.set_result(payload)
+                else:
+                    future.set_exception(Exception(payload.decode()))
+        except Exception as e:
+            error = e
+        for future in self.waiting.values():
+            if not future.done():
+                future.set_exception(error)
+        self.waiting.clear()
+
+    async def request(self, op, key, data):
+        if self.receiver.done():
+            raise Exception("Connection to the KEM service closed")
+        requestId = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[requestId] = future
+        write_frame(self.writer, struct.pack(REQUEST_FORMAT, requestId, op, len(key)) + key + data)
+        await self.writer.drain()
+        return await future
+
+    async def encode(self, msg, pk):
+        return await self.request(OP_ENCODE, bytes(pk), bytes(msg))
+
+    async def decode(self, ctx, sk):
+        return await self.request(OP_DECODE, bytes(sk), bytes(ctx))
+
+    async def stats(self):
+        return json.loads(await self.request(OP_STATS, b'', b''))
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        await asyncio.gather(self.receiver, return_exceptions=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+        return False
+
+
+async def serve(leda, path=None, host='127.0.0.1', port=0, **options):
+    service = await KEMService(leda, **options).start(path, host, port)
+    print("LEDA KEM service listening on", path if path is not None else service.address, flush=True)
+    try:
+        await service.server.serve_forever()
+    finally:
+        await service.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--category', type=int, default=1)
+    parser.add_argument('--n0', type=int, default=2)
+    parser.add_argument('--unix', metavar='PATH', help="listen on a Unix socket instead of TCP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7878)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--batch-delay', type=float, default=0.002, help="seconds to wait for a batch to fill")
+    parser.add_argument('--max-pending', type=int, default=1024)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(LEDACat.get(args.category, args.n0), args.unix, args.host, args.port, workers=args.workers,
+                          maxBatch=args.max_batch, batchDelay=args.batch_delay, maxPending=args.max_pending))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,233 @@
+import collections
+import hashlib
+import hmac
+import os
+import secrets
+import struct
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from .encode import encode
+from .decode import decode
+
+
+# Stream layout: header, LEDA ciphertext of the session key, then frames of chunk ciphertext + tag.
+# Every frame but the last holds exactly chunkSize plaintext bytes, so chunk i starts at a fixed offset.
+STREAM_MAGIC = b'LEDADEM1'
+# magic, N0, P, chunk size, LEDA ciphertext length
+STREAM_HEADER_FORMAT = '<8sIIII'
+STREAM_HEADER_SIZE = struct.calcsize(STREAM_HEADER_FORMAT)
+STREAM_KEY_BYTE_LENGTH = 32
+STREAM_TAG_BYTE_LENGTH = 16
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+# Encryption and MAC keys are bound to the whole header, so a frame cannot be moved to another stream
+def stream_keys(sessionKey, header):
+    keys = hashlib.shake_256(b'LEDA-DEM' + sessionKey + header).digest(2 * STREAM_KEY_BYTE_LENGTH)
+    return keys[:STREAM_KEY_BYTE_LENGTH], keys[STREAM_KEY_BYTE_LENGTH:]
+
+
+def chunk_keystream(encKey, index, length):
+    return np.frombuffer(hashlib.shake_256(encKey + index.to_bytes(8, 'big')).digest(length), dtype=np.uint8)
+
+
+# The final flag is authenticated so dropping trailing frames is detected
+def chunk_tag(macKey, index, final, ciphertext):
+    h = hashlib.sha3_256(macKey)
+    h.update(index.to_bytes(8, 'big') + (b'\x01' if final else b'\x00'))
+    h.update(ciphertext)
+    return h.digest()[:STREAM_TAG_BYTE_LENGTH]
+
+
+def seal_chunk(keys, index, final, data):
+    encKey, macKey = keys
+    ciphertext = (np.frombuffer(data, dtype=np.uint8) ^ chunk_keystream(encKey, index, len(data))).tobytes()
+    return ciphertext + chunk_tag(macKey, index, final, ciphertext)
+
+
+def open_chunk(keys, index, final, frame):
+    encKey, macKey = keys
+    ciphertext = memoryview(frame)[:len(frame) - STREAM_TAG_BYTE_LENGTH]
+    if not hmac.compare_digest(chunk_tag(macKey, index, final, ciphertext), bytes(frame[len(ciphertext):])):
+        raise Exception("Stream chunk {} failed authentication".format(index))
+    return (np.frombuffer(ciphertext, dtype=np.uint8) ^ chunk_keystream(encKey, index, len(ciphertext))).tobytes()
+
+
+def read_blocks(source, size):
+    if hasattr(source, 'read'):
+        while True:
+            block = source.read(size)
+            if not block:
+                return
+            yield block
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for start in range(0, len(view), size):
+            yield view[start:start + size]
+    else:
+        yield from source
+
+
+# Cuts the source into pieces of chunkSize bytes and marks the last one, which may be shorter.
+# An empty source still gives one empty final piece.
+def split_chunks(source, chunkSize):
+    buffer = bytearray()
+    for block in read_blocks(source, chunkSize):
+        buffer += block
+        start = 0
+        while len(buffer) - start > chunkSize:
+            yield bytes(buffer[start:start + chunkSize]), False
+            start += chunkSize
+        del buffer[:start]
+    yield bytes(buffer), True
+
+
+def submit_ordered(f, items, workers, executor):
+    pending = collections.deque()
+    for item in items:
+        pending.append(executor.submit(f, *item))
+        if len(pending) >= 2 * workers:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# Runs f over items on a thread pool (or the given executor), yielding results in order with at most
+# 2 * workers items in flight. hashlib and numpy release the GIL on large buffers, so threads scale
+# without copying chunks to processes. A caller's executor is left open; only a pool created here is shut down.
+def ordered_map(f, items, workers, executor=None):
+    if executor is not None:
+        yield from submit_ordered(f, items, max(1, workers), executor)
+    elif workers <= 1:
+        for item in items:
+            yield f(*item)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            yield from submit_ordered(f, items, workers, pool)
+
+
+def stream_header(leda, chunkSize, kemCiphertext):
+    return struct.pack(STREAM_HEADER_FORMAT, STREAM_MAGIC, leda.N0, leda.P, chunkSize, len(kemCiphertext)) + kemCiphertext
+
+
+def parse_stream_header(header, leda):
+    magic, N0, P, chunkSize, kemLength = struct.unpack(STREAM_HEADER_FORMAT, header)
+    if magic != STREAM_MAGIC:
+        raise Exception("Not a LEDA stream")
+    if (N0, P) != (leda.N0, leda.P):
+        raise Exception("Stream was encrypted for N0={} P={}, not N0={} P={}".format(N0, P, leda.N0, leda.P))
+    if chunkSize < 1:
+        raise Exception("Invalid stream chunk size " + str(chunkSize))
+    return chunkSize, kemLength
+
+
+# Encrypts a file object, bytes or an iterable of bytes and yields the framed stream piece by piece;
+# memory use is bounded by a few chunks regardless of the payload size
+def encrypt_stream(source, pk, leda, chunkSize=DEFAULT_CHUNK_SIZE, workers=None):
+    if chunkSize < 1:
+        raise Exception("Stream chunk size must be at least 1")
+    # the DEM key must not come from the reproducible TRNG used for LEDA seeds
+    sessionKey = secrets.token_bytes(STREAM_KEY_BYTE_LENGTH)
+    header = stream_header(leda, chunkSize, encode(sessionKey, pk, leda))
+    keys = stream_keys(sessionKey, header)
+    yield header
+
+    items = ((keys, index, final, data) for index, (data, final) in enumerate(split_chunks(source, chunkSize)))
+    yield from ordered_map(seal_chunk, items, workers or os.cpu_count() or 1)
+
+
+def decrypt_stream(source, sk, leda, workers=None):
+    blocks = read_blocks(source, DEFAULT_CHUNK_SIZE)
+    buffer = bytearray()
+
+    def fill(n):
+        while len(buffer) < n:
+            block = next(blocks, None)
+            if block is None:
+                return False
+            buffer.extend(block)
+        return True
+
+    if not fill(STREAM_HEADER_SIZE):
+        raise Exception("Truncated LEDA stream header")
+    chunkSize, kemLength = parse_stream_header(bytes(buffer[:STREAM_HEADER_SIZE]), leda)
+    if not fill(STREAM_HEADER_SIZE + kemLength):
+        raise Exception("Truncated LEDA stream header")
+    header = bytes(buffer[:STREAM_HEADER_SIZE + kemLength])
+    del buffer[:len(header)]
+    keys = stream_keys(decode(header[STREAM_HEADER_SIZE:], sk, leda), header)
+
+    frameSize = chunkSize + STREAM_TAG_BYTE_LENGTH
+
+    # a frame is the last one once no further byte follows it
+    def frames():
+        index = 0
+        while True:
+            more = fill(frameSize + 1)
+            if not more and len(buffer) < STREAM_TAG_BYTE_LENGTH:
+                raise Exception("Truncated LEDA stream")
+            frame = bytes(buffer[:frameSize])
+            del buffer[:frameSize]
+            yield keys, index, not more, frame
+            if not more:
+                return
+            index += 1
+
+    yield from ordered_map(open_chunk, frames(), workers or os.cpu_count() or 1)
+
+
+def encrypt_file(src, dst, pk, leda, chunkSize=DEFAULT_CHUNK_SIZE, workers=None):
+    for piece in encrypt_stream(src, pk, leda, chunkSize, workers):
+        dst.write(piece)
+
+
+def decrypt_file(src, dst, sk, leda, workers=None):
+    for piece in decrypt_stream(src, sk, leda, workers):
+        dst.write(piece)
+
+
+# Random access to a stream in a seekable file: only the frames covering a requested range are read and decrypted
+class StreamReader:
+    def __init__(self, f, sk, leda):
+        self.f = f
+        f.seek(0)
+        fixed = f.read(STREAM_HEADER_SIZE)
+        if len(fixed) < STREAM_HEADER_SIZE:
+            raise Exception("Truncated LEDA stream header")
+        self.chunkSize, kemLength = parse_stream_header(fixed, leda)
+        kemCiphertext = f.read(kemLength)
+        if len(kemCiphertext) < kemLength:
+            raise Exception("Truncated LEDA stream header")
+        header = fixed + kemCiphertext
+        self.keys = stream_keys(decode(kemCiphertext, sk, leda), header)
+        self.bodyOffset = len(header)
+        self.frameSize = self.chunkSize + STREAM_TAG_BYTE_LENGTH
+
+        body = f.seek(0, os.SEEK_END) - self.bodyOffset
+        if body < STREAM_TAG_BYTE_LENGTH:
+            raise Exception("Truncated LEDA stream")
+        self.chunkCount = max(1, (body + self.frameSize - 1) // self.frameSize)
+        lastFrame = body - (self.chunkCount - 1) * self.frameSize
+        if lastFrame < STREAM_TAG_BYTE_LENGTH:
+            raise Exception("Truncated LEDA stream")
+        self.size = (self.chunkCount - 1) * self.chunkSize + lastFrame - STREAM_TAG_BYTE_LENGTH
+
+    def __len__(self):
+        return self.size
+
+    def read_chunk(self, index):
+        if index < 0 or index >= self.chunkCount:
+            raise IndexError("Stream chunk {} out of range".format(index))
+        self.f.seek(self.bodyOffset + index * self.frameSize)
+        frame = self.f.read(self.frameSize)
+        return open_chunk(self.keys, index, index == self.chunkCount - 1, frame)
+
+    def read(self, offset, length):
+        end = min(offset + length, self.size)
+        if offset < 0 or offset >= end:
+            return b''
+        first, last = offset // self.chunkSize, (end - 1) // self.chunkSize
+        data = b''.join(self.read_chunk(i) for i in range(first, last + 1))
+        start = offset - first * self.chunkSize
+        return data[start:start + end - offset]
@@ -3,10 +3,10 @@ import numpy as np
 
 def remove_padding(arr):
     arr[-1] = 0
-    i = -1
-    while arr[i] == 0:
-        i -= 1
-    return arr[:i]
+    ones = np.flatnonzero(arr)
+    if ones.shape[0] == 0:
+        raise Exception("Invalid padding")
+    return arr[:ones[-1]]
 
 
 def add_padding(arr):
@@ -18,7 +18,7 @@ def add_padding(arr):
 
 
 def unpack_bytes(arr):
-    return remove_padding(np.unpackbits(np.array(list(arr), dtype=np.uint8)))
+    return remove_padding(np.unpackbits(np.frombuffer(arr, dtype=np.uint8)).view(bool))
 
 
 def pack_bytes(arr):
@@ -26,19 +26,56 @@ def pack_bytes(arr):
 
 
 def int_to_bitarray(x, byteLength):
-    return np.array([x & (0x1 << i) for i in reversed(range(8*byteLength))], dtype=bool)
-
-
-BIG_ENDIAN_MASK = np.array([128, 64, 32, 16, 8, 4, 2, 1], dtype=np.uint8)
+    return bytes_to_bitarray((x & ((1 << (8*byteLength)) - 1)).to_bytes(byteLength, byteorder='big'))
 
 
 def bytes_to_bitarray(arr):
-    return (np.array(list(arr), dtype=np.uint8).reshape(-1, 1) & BIG_ENDIAN_MASK).astype(bool).reshape(-1)
+    return np.unpackbits(np.frombuffer(arr, dtype=np.uint8)).view(bool)
 
 
 def bitarray_to_int(x):
-    r = 0
-    for i,v in enumerate(x.tolist()[::-1]):
-        if v == 1:
-            r += 2**i
-    return r
\ No newline at end of file
+    return int.from_bytes(np.packbits(x).tobytes(), byteorder='big') >> (-x.shape[0] % 8)
+
+
+# Byte-aligned bit string kept packed, bits are only expanded on request
+class BitBuffer:
+    def __init__(self, data):
+        self.data = data if isinstance(data, np.ndarray) else np.frombuffer(data, dtype=np.uint8)
+
+    @staticmethod
+    def zeros(byteLength):
+        return BitBuffer(np.zeros(byteLength, dtype=np.uint8))
+
+    @staticmethod
+    def from_bits(bits):
+        return BitBuffer(np.packbits(bits))
+
+    @staticmethod
+    def from_int(x, byteLength):
+        return BitBuffer(x.to_bytes(byteLength, byteorder='big'))
+
+    def __len__(self):
+        return 8 * self.data.shape[0]
+
+    def bits(self):
+        return np.unpackbits(self.data).view(bool)
+
+    def to_int(self):
+        return int.from_bytes(self.data.tobytes(), byteorder='big')
+
+    def tobytes(self):
+        return self.data.tobytes()
+
+    def remove_padding(self):
+        data = self.data.copy()
+        data[-1] &= 0xFE
+        nonzero = np.flatnonzero(data)
+        if nonzero.shape[0] == 0:
+            raise Exception("Invalid padding")
+        last = int(nonzero[-1])
+        lowest = int(data[last]) & -int(data[last])
+        bitLength = 8*last + 8 - lowest.bit_length()
+        out = data[:(bitLength + 7) // 8]
+        if bitLength % 8:
+            out[-1] &= (0xFF << (8 - bitLength % 8)) & 0xFF
+        return BitBuffer(out)
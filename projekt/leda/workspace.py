@@ -0,0 +1,44 @@
+import threading
+import numpy as np
+
+
+# Scratch arrays for one thread and one parameter set. A buffer is allocated the first time a name is
+# requested and handed out again afterwards; callers must not keep it past the call that requested it.
+class Workspace:
+    def __init__(self, leda):
+        self.N0 = leda.N0
+        self.P = leda.P
+        self.buffers = {}
+
+    def buffer(self, name, shape, dtype):
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self.buffers[name] = buf
+        return buf
+
+    # First n elements of a flat buffer that only grows, for scratch whose size depends on the data
+    def scratch(self, name, n, dtype):
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape[0] < n or buf.dtype != dtype:
+            buf = np.empty(max(n, 2 * (0 if buf is None else buf.shape[0]), 1024), dtype=dtype)
+            self.buffers[name] = buf
+        return buf[:n]
+
+    def zeros(self, name, shape, dtype):
+        buf = self.buffer(name, shape, dtype)
+        buf.fill(0)
+        return buf
+
+
+WORKSPACES = threading.local()
+
+
+def get_workspace(leda):
+    workspaces = getattr(WORKSPACES, 'byParameters', None)
+    if workspaces is None:
+        workspaces = WORKSPACES.byParameters = {}
+    ws = workspaces.get((leda.N0, leda.P))
+    if ws is None:
+        ws = workspaces[(leda.N0, leda.P)] = Workspace(leda)
+    return ws